@@ -1,28 +1,103 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, g, abort, Response, stream_with_context, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from datetime import datetime, timedelta
+import base64
+import csv
+import io
 import hashlib
 import secrets
+import sqlite3
 import json
 import os
 from functools import wraps
 import logging
+import time
+import zlib
 
-# إعدادات التطبيق
+import click
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.mutable import MutableDict
+
+from changebus import ChangeBus
+from ratelimit import SlidingWindowCounter
+from cache import GenerationTable, IdentityCache, SubscriptionCache
+from config import database_uri, engine_options, instance_secret
+from logqueue import LogWriter
+from metrics import Metrics
+import scheduler
+from workerpool import WorkerPool
+import httpcache
+import logarchive
+import logevents
+import logsearch
+import migrations
+import rollups
+
+# إعدادات التطبيق (PANEL_CONFIG لاختيار صنف إعدادات آخر)
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///panel.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config.from_object(os.environ.get('PANEL_CONFIG', 'config.Config'))
+if not os.environ.get('SECRET_KEY'):
+    app.config['SECRET_KEY'] = instance_secret(app.instance_path)
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(app.config)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
 
 # إعدادات قاعدة البيانات
 db = SQLAlchemy(app)
 
+@db.event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """تطبيق SQLITE_PRAGMAS على كل اتصال SQLite جديد"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config.get('SQLITE_PRAGMAS', {}).items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+# قياسات الأداء لكل طلب، مجمعة من كل العمال عبر instance/metrics
+metrics = Metrics(
+    os.path.join(app.instance_path, 'metrics'),
+    slow_threshold=app.config.get('METRICS_SLOW_REQUEST', 0.5),
+    flush_interval=app.config.get('METRICS_FLUSH_INTERVAL', 5.0)
+)
+metrics.init_app(app)
+
 # إعدادات تسجيل الدخول
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# ذاكرة مؤقتة لحالة الاشتراك، الإبطال مشترك بين العمال عبر ملف في instance
+subscription_cache = SubscriptionCache(
+    GenerationTable(os.path.join(app.instance_path, 'cache.gen'))
+)
+
+# ذاكرة مؤقتة لهوية المستخدم حتى لا يستعلم load_user في كل طلب
+identity_cache = IdentityCache(
+    GenerationTable(os.path.join(app.instance_path, 'identity.gen')),
+    ttl=app.config.get('IDENTITY_CACHE_TTL', 60)
+)
+
+# المحاولات الفاشلة لتسجيل الدخول لكل IP واسم مستخدم، مشتركة بين العمال
+login_attempts = SlidingWindowCounter(
+    os.path.join(app.instance_path, 'login.attempts'),
+    window=app.config.get('LOCKOUT_TIME', 900)
+)
+
+# إشعار المستمعين لبث الأحداث (/api/events) بأن بيانات المستخدم تغيرت
+change_bus = ChangeBus(GenerationTable(os.path.join(app.instance_path, 'changes.gen')))
+
+# الصفحات المعروضة: صفحات المستخدم تبطل بجيله في change_bus، وصفحات المطور
+# بالجيل العام هنا الذي يزيد مع أي كتابة على الكودات أو التفعيلات أو المستخدمين
+page_generations = GenerationTable(os.path.join(app.instance_path, 'pages.gen'), slots=1)
+page_cache = httpcache.PageCache(
+    max_entries=app.config.get('PAGE_CACHE_SIZE', 1000),
+    min_size=app.config.get('COMPRESS_MIN_SIZE', 500),
+    level=app.config.get('COMPRESS_LEVEL', 6)
+)
+
 # --- نماذج قاعدة البيانات ---
 
 class User(UserMixin, db.Model):
@@ -35,6 +110,11 @@ class User(UserMixin, db.Model):
     last_login = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='active')
     
+    __table_args__ = (
+        db.Index('ix_user_created', 'created_at'),
+        db.Index('ix_user_status_created', 'status', 'created_at'),
+    )
+    
     def set_password(self, password):
         self.password_hash = hashlib.sha256(password.encode()).hexdigest()
     
@@ -46,15 +126,24 @@ class ActivationCode(db.Model):
     code = db.Column(db.String(50), unique=True, nullable=False)
     duration_days = db.Column(db.Integer, nullable=False)
     max_users = db.Column(db.Integer, nullable=False, default=1)
+    # المقاعد المتبقية، تنقص عند التفعيل وتعود عند انتهاء التفعيل
+    remaining_seats = db.Column(db.Integer, default=lambda context: context.get_current_parameters()['max_users'])
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime)
-    status = db.Column(db.String(20), default='active')
+    batch_id = db.Column(db.String(32), index=True)  # دفعة الإنشاء الجماعي
+    # active_history لتحميل الحالة السابقة عند التغيير (لعداد active_codes)
+    status = db.column_property(db.Column(db.String(20), default='active'), active_history=True)
     notes = db.Column(db.Text)
     
     # العلاقات
     creator = db.relationship('User', backref='created_codes')
     activations = db.relationship('Activation', backref='activation_code', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_activation_code_status_created', 'status', 'created_at'),
+        db.Index('ix_activation_code_created', 'created_at'),
+    )
 
 class Activation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -66,6 +155,40 @@ class Activation(db.Model):
     
     # العلاقات
     user = db.relationship('User', backref='activations')
+    
+    __table_args__ = (
+        db.Index('ix_activation_user_status_expires', 'user_id', 'status', 'expires_at'),
+        db.Index('ix_activation_code_status', 'code_id', 'status'),
+        db.Index('ix_activation_status_expires', 'status', 'expires_at'),
+    )
+
+class CompactJSON(db.TypeDecorator):
+    """قاموس JSON في عمود ثنائي، مضغوط بـ zlib إذا كان ذلك أصغر"""
+    impl = db.LargeBinary
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if not value:
+            return None
+        raw = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+        packed = zlib.compress(raw)
+        return b'z' + packed if len(packed) < len(raw) else b'j' + raw
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        value = bytes(value)
+        raw = zlib.decompress(value[1:]) if value[:1] == b'z' else value[1:]
+        return json.loads(raw)
+
+# حقول بيانات الاتصال التي لها أعمدة مفهرسة للتصفية والترتيب
+PROMOTED_CONNECTION_FIELDS = ('region', 'last_error')
+
+def split_connection_data(data):
+    """فصل الحقول المرقاة عن بقية بيانات الاتصال، يعيد (المرقاة، الباقي)"""
+    rest = dict(data or {})
+    promoted = {field: rest.pop(field) for field in PROMOTED_CONNECTION_FIELDS if field in rest}
+    return promoted, rest
 
 class BotAccount(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -76,34 +199,337 @@ class BotAccount(db.Model):
     status = db.Column(db.String(20), default='inactive')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_activity = db.Column(db.DateTime)
-    connection_data = db.Column(db.Text)  # JSON format
+    region = db.Column(db.String(10))  # من Config.GAME_REGIONS
+    last_error = db.Column(db.String(500))
+    last_error_at = db.Column(db.DateTime)
+    # بقية بيانات الاتصال: لا تحمل مع قوائم البوتات، تقرأ وتفك عند أول وصول
+    connection_data = db.deferred(db.Column('connection_blob', MutableDict.as_mutable(CompactJSON)))
     
     # العلاقات
     user = db.relationship('User', backref='bot_accounts')
+    jobs = db.relationship('BotJob', backref='bot', lazy='dynamic', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_bot_account_user_created', 'user_id', 'created_at'),
+        db.Index('ix_bot_account_user_region_created', 'user_id', 'region', 'created_at'),
+        db.Index('ix_bot_account_user_error', 'user_id', 'last_error_at'),
+    )
+    
+    def set_connection_data(self, data):
+        """حفظ بيانات الاتصال: الحقول المرقاة في أعمدتها والباقي مضغوطاً"""
+        promoted, rest = split_connection_data(data)
+        if 'last_error' in promoted and (promoted['last_error'] != self.last_error or self.last_error_at is None):
+            # قوائم الأخطاء تصفي وترتب حسب last_error_at
+            self.last_error_at = datetime.utcnow() if promoted['last_error'] else None
+        for field, value in promoted.items():
+            setattr(self, field, value)
+        self.connection_data = rest or None
+
+class BotJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    bot_id = db.Column(db.Integer, db.ForeignKey('bot_account.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    action = db.Column(db.String(20), nullable=False)  # start, stop
+    status = db.Column(db.String(20), default='queued')  # queued, running, succeeded, failed
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_bot_job_status_id', 'status', 'id'),
+        db.Index('ix_bot_job_bot_status', 'bot_id', 'status'),
+    )
 
 class ConnectionLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     ip_address = db.Column(db.String(50))
-    action = db.Column(db.String(100))
-    details = db.Column(db.Text)
+    event = db.Column(db.SmallInteger)  # logevents.CONNECTION_EVENTS
+    params = db.Column(db.Text)  # JSON مختصر
+    # نص السجلات القديمة التي لم يمكن ترميزها (NULL للسجلات المرمزة)
+    legacy_action = db.Column('action', db.String(100))
+    legacy_details = db.Column('details', db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     # العلاقات
     user = db.relationship('User', backref='connection_logs')
+    
+    __table_args__ = (
+        db.Index('ix_connection_log_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_connection_log_timestamp', 'timestamp'),
+        db.Index('ix_connection_log_event_timestamp', 'event', 'timestamp'),
+    )
+    
+    @property
+    def action(self):
+        if self.event is None:
+            return self.legacy_action
+        return logevents.BY_CODE[self.event].label
+    
+    @property
+    def details(self):
+        if self.event is None or self.legacy_details is not None:
+            return self.legacy_details
+        return logevents.render(self.event, self.params, self.user.username if self.user else None)[1]
 
 class SystemLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    log_type = db.Column(db.String(50))
-    message = db.Column(db.Text)
-    details = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    event = db.Column(db.SmallInteger)  # logevents.SYSTEM_EVENTS
+    params = db.Column(db.Text)  # JSON مختصر
+    # نص السجلات القديمة التي لم يمكن ترميزها (NULL للسجلات المرمزة)
+    legacy_log_type = db.Column('log_type', db.String(50))
+    legacy_message = db.Column('message', db.Text)
+    legacy_details = db.Column('details', db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # العلاقات
+    user = db.relationship('User')
+    
+    __table_args__ = (
+        db.Index('ix_system_log_timestamp', 'timestamp'),
+        db.Index('ix_system_log_event_timestamp', 'event', 'timestamp'),
+    )
+    
+    def _rendered(self, index, legacy):
+        if self.event is None or legacy is not None:
+            return legacy
+        return logevents.render(self.event, self.params, self.user.username if self.user else None)[index]
+    
+    @property
+    def log_type(self):
+        return self._rendered(0, self.legacy_log_type)
+    
+    @property
+    def message(self):
+        return self._rendered(1, self.legacy_message)
+    
+    @property
+    def details(self):
+        return self._rendered(2, self.legacy_details)
+
+class StatCounter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+# --- البحث النصي في السجلات (FTS5) ---
+
+# الأعمدة المفهرسة: نص السجل كما يعرض (المبني من الحدث أو القديم) واسم المستخدم
+LOG_SEARCH_COLUMNS = {
+    ConnectionLog: ('action', 'details', 'username'),
+    SystemLog: ('log_type', 'message', 'details', 'username'),
+}
+
+LOG_EVENTS = {
+    ConnectionLog: logevents.CONNECTION_EVENTS,
+    SystemLog: logevents.SYSTEM_EVENTS,
+}
+
+def log_search_view(model):
+    """SELECT يبني أعمدة LOG_SEARCH_COLUMNS لكل سجل (SQLite)
+
+    نفس منطق خصائص النموذج: السجل المرمز يبنى نصه من القالب ومعاملاته، ونص
+    السجل القديم (أو الذي لم يحذف نصه عند الترميز) يفهرس كما هو.
+    """
+    def field(name):
+        return 'u.username' if name == 'username' else f"json_extract(l.params, '$.{name}')"
+    
+    events = LOG_EVENTS[model]
+    text_columns = LOG_SEARCH_COLUMNS[model][:-1]
+    selected = [f'CASE WHEN l.event IS NULL THEN l.{text_columns[0]} '
+                f'ELSE {logevents.render_sql(events, "l.event", 0, field)} END AS {text_columns[0]}']
+    for index, column in enumerate(text_columns[1:], 1):
+        selected.append(f'CASE WHEN l.event IS NULL OR l.{column} IS NOT NULL THEN l.{column} '
+                        f'ELSE {logevents.render_sql(events, "l.event", index, field)} END AS {column}')
+    return (f'SELECT l.id AS id, {", ".join(selected)}, u.username AS username '
+            f'FROM {model.__tablename__} AS l LEFT JOIN user AS u ON u.id = l.user_id')
+
+def install_log_search_index(connection, model, rebuild=False):
+    return logsearch.install(connection, model.__tablename__, LOG_SEARCH_COLUMNS[model],
+                             rebuild=rebuild, view=log_search_view(model))
+
+def install_log_search(table, connection, **kw):
+    # يستدعى عند إنشاء الجدول بـ create_all (قاعدة بيانات جديدة)
+    for model in LOG_SEARCH_COLUMNS:
+        if model.__table__ is table:
+            install_log_search_index(connection, model)
+
+for search_model in LOG_SEARCH_COLUMNS:
+    db.event.listen(search_model.__table__, 'after_create', install_log_search)
+
+# --- الإحصائيات ---
+
+# اسم العداد -> (النموذج، الحالة المحسوبة أو None لكل الصفوف)
+STAT_COUNTERS = {
+    'total_users': (User, None),
+    'total_activations': (Activation, None),
+    'total_codes': (ActivationCode, None),
+    'active_codes': (ActivationCode, 'active'),
+    'total_bots': (BotAccount, None),
+}
+
+def adjust_counter(connection, name, delta):
+    """تعديل عداد عام داخل نفس المعاملة"""
+    counters = StatCounter.__table__
+    connection.execute(
+        counters.update()
+        .where(counters.c.name == name)
+        .values(value=counters.c.value + delta)
+    )
+
+def track_counter(name, model, status):
+    """إبقاء العداد محدثاً عند الإضافة والحذف وتغيير الحالة"""
+    def counted(value):
+        return status is None or value == status
+
+    @db.event.listens_for(model, 'after_insert')
+    def after_insert(mapper, connection, target):
+        if counted(target.status):
+            adjust_counter(connection, name, 1)
+
+    @db.event.listens_for(model, 'after_delete')
+    def after_delete(mapper, connection, target):
+        if counted(target.status):
+            adjust_counter(connection, name, -1)
+
+    if status is not None:
+        @db.event.listens_for(model, 'after_update')
+        def after_update(mapper, connection, target):
+            history = db.inspect(target).attrs.status.history
+            if history.deleted:
+                delta = counted(target.status) - counted(history.deleted[0])
+                if delta:
+                    adjust_counter(connection, name, delta)
+
+for counter_name, (counter_model, counter_status) in STAT_COUNTERS.items():
+    track_counter(counter_name, counter_model, counter_status)
+
+def rebuild_stat_counters():
+    """إعادة حساب العدادات العامة من الجداول (عند التهيئة فقط)"""
+    for name, (model, status) in STAT_COUNTERS.items():
+        query = db.session.query(db.func.count(model.id))
+        if status is not None:
+            query = query.filter(model.status == status)
+        db.session.merge(StatCounter(name=name, value=query.scalar()))
+    db.session.commit()
+
+def get_global_stats():
+    """الإحصائيات العامة من العدادات بدون مسح الجداول"""
+    stats = dict(db.session.query(StatCounter.name, StatCounter.value).all())
+    if len(stats) < len(STAT_COUNTERS):
+        rebuild_stat_counters()
+        stats = dict(db.session.query(StatCounter.name, StatCounter.value).all())
+    return stats
+
+def get_user_stats(user_id):
+    """إحصائيات المستخدم في استعلام واحد"""
+    total_codes = db.session.query(db.func.count(Activation.id)).filter(
+        Activation.user_id == user_id
+    ).scalar_subquery()
+    
+    total_bots, active_bots, total_codes = db.session.query(
+        db.func.count(BotAccount.id),
+        db.func.coalesce(db.func.sum(db.case((BotAccount.status == 'active', 1), else_=0)), 0),
+        total_codes
+    ).filter(BotAccount.user_id == user_id).one()
+    
+    return {
+        'total_bots': total_bots,
+        'active_bots': active_bots,
+        'total_codes': total_codes
+    }
+
+def get_bot_status_counts(user_id):
+    """عدد بوتات المستخدم لكل حالة في استعلام واحد"""
+    return dict(db.session.query(BotAccount.status, db.func.count(BotAccount.id))
+                .filter(BotAccount.user_id == user_id)
+                .group_by(BotAccount.status).all())
 
 # --- دوال المساعدة ---
 
+# حقول الهوية المخزنة مؤقتاً، تغييرها يبطل الذاكرة المؤقتة
+IDENTITY_FIELDS = ('username', 'is_developer', 'status', 'last_login')
+
+class UserSnapshot(UserMixin):
+    """نسخة مختصرة من المستخدم، باقي الحقول والعلاقات تحمل عند أول استخدام"""
+    
+    def __init__(self, id, username, is_developer, status, last_login):
+        self.id = id
+        self.username = username
+        self.is_developer = is_developer
+        self.status = status
+        self.last_login = last_login
+    
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if '_user' not in self.__dict__:
+            self._user = db.session.get(User, self.id)
+        return getattr(self._user, name)
+
+def load_identity(user_id):
+    row = db.session.query(
+        User.id, *(getattr(User, field) for field in IDENTITY_FIELDS)
+    ).filter(User.id == user_id).first()
+    return tuple(row) if row else None
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    identity = identity_cache.get(int(user_id), load_identity)
+    if not identity:
+        return None
+    user = UserSnapshot(*identity)
+    # الحساب المعطل يخرج من جلساته المفتوحة أيضاً
+    return user if user.status == 'active' else None
+
+@db.event.listens_for(User, 'after_update')
+def user_identity_changed(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in IDENTITY_FIELDS):
+        state.session.info.setdefault('identity_changed', set()).add(target.id)
+
+@db.event.listens_for(User, 'after_delete')
+def user_identity_deleted(mapper, connection, target):
+    db.inspect(target).session.info.setdefault('identity_changed', set()).add(target.id)
+
+@db.event.listens_for(BotAccount, 'after_insert')
+@db.event.listens_for(BotAccount, 'after_update')
+@db.event.listens_for(BotAccount, 'after_delete')
+def bot_changed(mapper, connection, target):
+    db.inspect(target).session.info.setdefault('bots_changed', set()).add(target.user_id)
+
+def changes_site_pages(obj):
+    """هل يغير الكائن ما تعرضه صفحات المطور (الإحصائيات، الكودات، التفعيلات)"""
+    if isinstance(obj, (ActivationCode, Activation)):
+        return True
+    if isinstance(obj, User):
+        # آخر دخول يتغير مع كل تسجيل دخول ولا يظهر في صفحات المطور
+        return any(attr.history.has_changes() for attr in db.inspect(obj).attrs if attr.key != 'last_login')
+    return False
+
+@db.event.listens_for(db.session, 'after_flush')
+def mark_site_pages_changed(session, flush_context):
+    added_or_deleted = (obj for obj in [*session.new, *session.deleted]
+                        if isinstance(obj, (User, ActivationCode, Activation, BotAccount)))
+    if any(added_or_deleted) or any(changes_site_pages(obj) for obj in session.dirty):
+        session.info['site_pages_changed'] = True
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidate_changed_identities(session):
+    # الإبطال بعد الحفظ فقط حتى لا يعيد عامل آخر تحميل القيمة القديمة
+    for user_id in session.info.pop('identity_changed', ()):
+        identity_cache.invalidate(user_id)
+    for user_id in session.info.pop('bots_changed', ()):
+        change_bus.publish(user_id)
+    if session.info.pop('site_pages_changed', False):
+        page_generations.bump_all()
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_changed_identities(session):
+    session.info.pop('identity_changed', None)
+    session.info.pop('bots_changed', None)
+    session.info.pop('site_pages_changed', None)
 
 def developer_required(f):
     @wraps(f)
@@ -114,48 +540,356 @@ def developer_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def load_active_until(user_id):
+    """تاريخ انتهاء آخر تفعيل نشط للمستخدم من قاعدة البيانات"""
+    return db.session.query(db.func.max(Activation.expires_at)).filter(
+        Activation.user_id == user_id,
+        Activation.status == 'active',
+        Activation.expires_at > datetime.utcnow()
+    ).scalar()
+
+def get_active_until(user_id):
+    """تاريخ انتهاء الاشتراك النشط عبر الذاكرة المؤقتة"""
+    return subscription_cache.get(user_id, load_active_until)
+
 def check_activation_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not current_user.is_developer:
             # التحقق من صلاحية الاشتراك
-            activation = Activation.query.filter_by(
-                user_id=current_user.id, 
-                status='active'
-            ).filter(Activation.expires_at > datetime.utcnow()).first()
+            g.active_until = get_active_until(current_user.id)
             
-            if not activation:
+            if not g.active_until:
                 flash('انتهت صلاحية اشتراكك!', 'danger')
                 return redirect(url_for('activate_account'))
         
         return f(*args, **kwargs)
     return decorated_function
 
+# يتغير مع تعديل الكود أو القوالب فلا تطابق ETag قديمة بعد النشر
+PAGE_VERSION = max(
+    os.path.getmtime(path) for path in [__file__] + [
+        os.path.join(root, name)
+        for root, _, names in os.walk(os.path.join(app.root_path, app.template_folder))
+        for name in names
+    ]
+)
+
+def cached_page(scope):
+    """حفظ الصفحة المعروضة مع ETag/Last-Modified، scope: 'user' أو 'site'
+
+    الـ ETag يحسب من أجيال الذاكرة المشتركة فقط، فالطلب المتكرر لصفحة لم
+    تتغير يعود 304 أو يخدم من الذاكرة بدون استعلامات ولا عرض القالب.
+    يوضع بعد login_required و check_activation_required.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # الرسائل المؤقتة (flash) تعرض مرة واحدة فلا تحفظ الصفحة معها
+            if request.method != 'GET' or session.get('_flashes'):
+                return f(*args, **kwargs)
+            
+            user_id = current_user.id
+            generation = change_bus.generation(user_id) if scope == 'user' else page_generations.get(0)
+            # التاريخ لأن القوالب تعرض الأيام المتبقية
+            etag = httpcache.make_etag(PAGE_VERSION, request.full_path, user_id, datetime.utcnow().date(),
+                                       identity_cache.generations.get(user_id), generation)
+            
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag, weak=True)
+                return response
+            
+            key = (user_id, request.full_path)
+            page = page_cache.get(key, etag)
+            if page is None:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                page = page_cache.put(key, etag, response.mimetype, response.get_data())
+            
+            body, encoding = page_cache.body(page, httpcache.choose_encoding(request.accept_encodings))
+            response = Response(body, mimetype=page.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            response.set_etag(etag, weak=True)
+            response.last_modified = page.last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return decorated_function
+    return decorator
+
+@app.after_request
+def compress_response(response):
+    """ضغط استجابات HTML/JSON حسب Accept-Encoding (الصفحات المحفوظة مضغوطة مسبقاً)"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in httpcache.COMPRESSIBLE):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = httpcache.choose_encoding(request.accept_encodings)
+    if encoding is None or len(data) < app.config.get('COMPRESS_MIN_SIZE', 500):
+        return response
+    
+    response.set_data(httpcache.compress(data, encoding, app.config.get('COMPRESS_LEVEL', 6)))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
 def generate_activation_code():
     """إنشاء كود تفعيل فريد"""
     return f"FF-{secrets.token_hex(8).upper()}"
 
-def log_activity(user_id, action, details=""):
-    """تسجيل نشاط المستخدم"""
-    ip_address = request.remote_addr
-    log = ConnectionLog(
-        user_id=user_id,
-        ip_address=ip_address,
-        action=action,
-        details=details
-    )
-    db.session.add(log)
+MAX_CODE_BATCH = 10000
+
+def insert_ignoring_conflicts(table, *columns):
+    """INSERT يتجاهل الصفوف المتعارضة مع قيد unique بدل إفشال المعاملة"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing(index_elements=columns)
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=columns)
+    return table.insert().prefix_with('IGNORE')
+
+def mint_codes(count, duration_days, max_users, creator_id, notes='', attempts=5):
+    """إنشاء count كود في معاملة واحدة بإدراج جماعي، يعيد (batch_id, الأكواد)
+
+    الأكواد المتعارضة مع أكواد موجودة فقط يعاد توليدها.
+    """
+    batch_id = secrets.token_hex(8)
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=365)  # الكود صالح لمدة سنة
+    insert = insert_ignoring_conflicts(ActivationCode.__table__, 'code')
+    
+    minted = []
+    for _ in range(attempts):
+        candidates = {generate_activation_code() for _ in range(count - len(minted))}
+        db.session.execute(insert, [{
+            'code': code,
+            'duration_days': duration_days,
+            'max_users': max_users,
+            'remaining_seats': max_users,
+            'creator_id': creator_id,
+            'created_at': now,
+            'expires_at': expires_at,
+            'status': 'active',
+            'notes': notes,
+            'batch_id': batch_id
+        } for code in candidates])
+        
+        minted = db.session.scalars(
+            db.select(ActivationCode.code).where(ActivationCode.batch_id == batch_id)
+        ).all()
+        if len(minted) == count:
+            break
+    else:
+        db.session.rollback()
+        raise RuntimeError('تعذر توليد أكواد فريدة')
+    
+    # الإدراج الجماعي لا يمر بأحداث النماذج
+    connection = db.session.connection()
+    adjust_counter(connection, 'total_codes', count)
+    adjust_counter(connection, 'active_codes', count)
+    db.session.info['site_pages_changed'] = True
     db.session.commit()
+    return batch_id, minted
 
-def system_log(log_type, message, details=""):
-    """تسجيل حدث في النظام"""
-    log = SystemLog(
-        log_type=log_type,
-        message=message,
-        details=details
-    )
-    db.session.add(log)
+def redeem_code(user_id, activation_code):
+    """حجز مقعد في الكود وإنشاء التفعيل في معاملة واحدة
+
+    الحجز تحديث شرطي (remaining_seats > 0) لذلك لا يمكن لعاملين تجاوز
+    max_users معاً. يعيد تاريخ انتهاء التفعيل أو None إذا لم تبق مقاعد.
+    """
+    reserved = db.session.execute(
+        db.update(ActivationCode)
+        .where(ActivationCode.id == activation_code.id,
+               ActivationCode.status == 'active',
+               ActivationCode.remaining_seats > 0)
+        .values(remaining_seats=ActivationCode.remaining_seats - 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    
+    if not reserved:
+        db.session.rollback()
+        return None
+    
+    expires_at = datetime.utcnow() + timedelta(days=activation_code.duration_days)
+    db.session.add(Activation(
+        user_id=user_id,
+        code_id=activation_code.id,
+        expires_at=expires_at
+    ))
     db.session.commit()
+    return expires_at
+
+# --- الترقيم بالمؤشر (keyset) على (created_at, id) أو (timestamp, id) ---
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(value, item_id):
+    raw = f"{value.isoformat()}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        value, item_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(value), int(item_id)
+    except ValueError:
+        abort(400)
+
+def parse_datetime_arg(name):
+    """قراءة تاريخ بصيغة ISO من معاملات الطلب"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400)
+
+def paginate_keyset(query, model, column='created_at', cursor_arg='cursor'):
+    """صفحة مرتبة تنازلياً بـ (column, id) تبدأ بعد المؤشر في ?cursor=
+
+    تكلفة الصفحة ثابتة مهما كبر الجدول لأنها تقرأ من الفهرس مباشرة بدون OFFSET.
+    """
+    limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    order = getattr(model, column)
+    
+    status = request.args.get('status')
+    if status and hasattr(model, 'status'):
+        query = query.filter(model.status == status)
+    
+    cursor = request.args.get(cursor_arg)
+    if cursor:
+        value, item_id = decode_cursor(cursor)
+        # الشرط الأول يسمح بالبحث في الفهرس بدل مسحه من البداية
+        query = query.filter(
+            order <= value,
+            db.or_(order < value, model.id < item_id)
+        )
+    
+    items = query.order_by(order.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        last = items[limit - 1]
+        next_cursor = encode_cursor(getattr(last, column), last.id)
+    return items[:limit], next_cursor
+
+def serialize_code(code):
+    return {
+        'id': code.id,
+        'code': code.code,
+        'duration_days': code.duration_days,
+        'max_users': code.max_users,
+        'status': code.status,
+        'notes': code.notes,
+        'created_at': code.created_at.isoformat(),
+        'expires_at': code.expires_at.isoformat() if code.expires_at else None
+    }
+
+def serialize_user(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'is_developer': user.is_developer,
+        'status': user.status,
+        'created_at': user.created_at.isoformat(),
+        'last_login': user.last_login.isoformat() if user.last_login else None
+    }
+
+def serialize_connection_log(log):
+    return {
+        'id': log.id,
+        'user_id': log.user_id,
+        'username': log.user.username if log.user else None,
+        'ip_address': log.ip_address,
+        'action': log.action,
+        'details': log.details,
+        'timestamp': log.timestamp.isoformat()
+    }
+
+def serialize_system_log(log):
+    return {
+        'id': log.id,
+        'log_type': log.log_type,
+        'message': log.message,
+        'details': log.details,
+        'timestamp': log.timestamp.isoformat()
+    }
+
+def serialize_bot(bot):
+    return {
+        'id': bot.id,
+        'uid': bot.uid,
+        'nickname': bot.nickname,
+        'status': bot.status,
+        'region': bot.region,
+        'last_error': bot.last_error,
+        'last_error_at': bot.last_error_at.isoformat() if bot.last_error_at else None,
+        'created_at': bot.created_at.isoformat(),
+        'last_activity': bot.last_activity.isoformat() if bot.last_activity else None
+    }
+
+def serialize_bot_job(job):
+    return {
+        'id': job.id,
+        'bot_id': job.bot_id,
+        'action': job.action,
+        'status': job.status,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def write_log_batch(batch):
+    """إدراج دفعة من السجلات دفعة واحدة لكل جدول"""
+    rows = {}
+    for model, row in batch:
+        rows.setdefault(model, []).append(row)
+    
+    with app.app_context():
+        try:
+            for model, model_rows in rows.items():
+                db.session.execute(model.__table__.insert(), model_rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    
+    for user_id in {row['user_id'] for row in rows.get(ConnectionLog, ())}:
+        change_bus.publish(user_id)
+
+log_writer = LogWriter(
+    write_log_batch,
+    batch_size=app.config.get('LOG_BATCH_SIZE', 200),
+    flush_interval=app.config.get('LOG_FLUSH_INTERVAL', 1.0),
+    max_queue=app.config.get('LOG_QUEUE_SIZE', 10000)
+)
+
+def log_activity(user_id, event, **params):
+    """تسجيل نشاط المستخدم (حدث من logevents.CONNECTION_EVENTS)"""
+    log_writer.put(ConnectionLog, {
+        'user_id': user_id,
+        'ip_address': request.remote_addr,
+        'event': logevents.CONNECTION_BY_NAME[event].code,
+        'params': logevents.encode_params(params),
+        'timestamp': datetime.utcnow()
+    })
+
+def system_log(event, user_id=None, **params):
+    """تسجيل حدث في النظام (حدث من logevents.SYSTEM_EVENTS)"""
+    log_writer.put(SystemLog, {
+        'user_id': user_id,
+        'event': logevents.SYSTEM_BY_NAME[event].code,
+        'params': logevents.encode_params(params),
+        'timestamp': datetime.utcnow()
+    })
 
 # --- المسارات (Routes) ---
 
@@ -165,6 +899,15 @@ def index():
         return redirect(url_for('dashboard'))
     return render_template('index.html')
 
+def login_keys(username):
+    return (f'ip:{request.remote_addr}', f"user:{(username or '').strip().lower()}")
+
+def login_throttled(username):
+    """هل تجاوز عنوان IP أو اسم المستخدم حد المحاولات الفاشلة (بدون قاعدة البيانات)"""
+    ip_key, user_key = login_keys(username)
+    return (login_attempts.count(ip_key) >= app.config.get('MAX_LOGIN_ATTEMPTS_PER_IP', 20)
+            or login_attempts.count(user_key) >= app.config.get('MAX_LOGIN_ATTEMPTS', 5))
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -174,17 +917,25 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
+        if login_throttled(username):
+            lockout = app.config.get('LOCKOUT_TIME', 900)
+            flash(f'محاولات كثيرة! حاول مرة أخرى بعد {lockout // 60} دقيقة', 'danger')
+            return render_template('login.html'), 429, {'Retry-After': str(lockout)}
+        
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password) and user.status == 'active':
             login_user(user)
             user.last_login = datetime.utcnow()
             db.session.commit()
+            login_attempts.reset(login_keys(username)[1])
             
-            log_activity(user.id, 'تسجيل دخول', f'المستخدم {username} قام بتسجيل الدخول')
+            log_activity(user.id, 'login')
             flash('تم تسجيل الدخول بنجاح!', 'success')
             return redirect(url_for('dashboard'))
         else:
+            for key in login_keys(username):
+                login_attempts.hit(key)
             flash('اسم المستخدم أو كلمة المرور غير صحيحة!', 'danger')
     
     return render_template('login.html')
@@ -209,7 +960,7 @@ def register():
         db.session.add(user)
         db.session.commit()
         
-        system_log('register', f'مستخدم جديد {username} قام بالتسجيل')
+        system_log('register', user.id)
         flash('تم إنشاء الحساب بنجاح! قم بتسجيل الدخول', 'success')
         return redirect(url_for('login'))
     
@@ -218,7 +969,7 @@ def register():
 @app.route('/logout')
 @login_required
 def logout():
-    log_activity(current_user.id, 'تسجيل خروج', f'المستخدم {current_user.username} قام بتسجيل الخروج')
+    log_activity(current_user.id, 'logout')
     logout_user()
     flash('تم تسجيل الخروج بنجاح!', 'success')
     return redirect(url_for('index'))
@@ -226,23 +977,13 @@ def logout():
 @app.route('/dashboard')
 @login_required
 @check_activation_required
+@cached_page('user')
 def dashboard():
     # إحصائيات
-    stats = {
-        'total_bots': BotAccount.query.filter_by(user_id=current_user.id).count(),
-        'active_bots': BotAccount.query.filter_by(user_id=current_user.id, status='active').count(),
-        'total_codes': Activation.query.filter_by(user_id=current_user.id).count(),
-        'active_until': None
-    }
+    stats = get_user_stats(current_user.id)
     
-    # الحصول على تاريخ انتهاء الصلاحية
-    activation = Activation.query.filter_by(
-        user_id=current_user.id, 
-        status='active'
-    ).filter(Activation.expires_at > datetime.utcnow()).first()
-    
-    if activation:
-        stats['active_until'] = activation.expires_at
+    # الحصول على تاريخ انتهاء الصلاحية (محسوب مسبقاً في check_activation_required)
+    stats['active_until'] = g.get('active_until') or get_active_until(current_user.id)
     
     # آخر النشاطات
     recent_logs = ConnectionLog.query.filter_by(user_id=current_user.id).order_by(
@@ -263,12 +1004,6 @@ def activate_account():
             flash('كود التفعيل غير صالح!', 'danger')
             return redirect(url_for('activate_account'))
         
-        # التحقق من عدد المستخدمين
-        user_count = Activation.query.filter_by(code_id=activation_code.id, status='active').count()
-        if user_count >= activation_code.max_users:
-            flash('تم الوصول للحد الأقصى للمستخدمين لهذا الكود!', 'danger')
-            return redirect(url_for('activate_account'))
-        
         # التحقق من عدم التفعيل المسبق
         existing = Activation.query.filter_by(
             user_id=current_user.id, 
@@ -280,20 +1015,18 @@ def activate_account():
             flash('لقد قمت بتفعيل هذا الكود مسبقاً!', 'warning')
             return redirect(url_for('dashboard'))
         
-        # إنشاء التفعيل
-        expires_at = datetime.utcnow() + timedelta(days=activation_code.duration_days)
-        
-        activation = Activation(
-            user_id=current_user.id,
-            code_id=activation_code.id,
-            expires_at=expires_at
-        )
+        # إنشاء التفعيل مع التحقق من عدد المستخدمين
+        expires_at = redeem_code(current_user.id, activation_code)
+        if not expires_at:
+            flash('تم الوصول للحد الأقصى للمستخدمين لهذا الكود!', 'danger')
+            return redirect(url_for('activate_account'))
         
-        db.session.add(activation)
-        db.session.commit()
+        subscription_cache.invalidate(current_user.id)
+        change_bus.publish(current_user.id)
+        job_scheduler.wake('expire-activations', expires_at)
         
-        log_activity(current_user.id, 'تفعيل اشتراك', f'كود: {code} - المدة: {activation_code.duration_days} يوم')
-        system_log('activation', f'المستخدم {current_user.username} قام بتفعيل الكود {code}')
+        log_activity(current_user.id, 'subscription', code=code, days=activation_code.duration_days)
+        system_log('activation', current_user.id, code=code)
         
         flash(f'تم التفعيل بنجاح! صلاحيتك تنتهي في {expires_at.strftime("%Y-%m-%d %H:%M")}', 'success')
         return redirect(url_for('dashboard'))
@@ -305,13 +1038,9 @@ def activate_account():
 @app.route('/developer')
 @login_required
 @developer_required
+@cached_page('site')
 def developer_dashboard():
-    stats = {
-        'total_users': User.query.count(),
-        'total_activations': Activation.query.count(),
-        'active_codes': ActivationCode.query.filter_by(status='active').count(),
-        'total_bots': BotAccount.query.count()
-    }
+    stats = get_global_stats()
     
     recent_activations = Activation.query.order_by(Activation.activated_at.desc()).limit(10).all()
     recent_codes = ActivationCode.query.order_by(ActivationCode.created_at.desc()).limit(10).all()
@@ -324,34 +1053,109 @@ def developer_dashboard():
 @app.route('/developer/codes', methods=['GET', 'POST'])
 @login_required
 @developer_required
+@cached_page('site')
 def manage_codes():
     if request.method == 'POST':
         duration_days = int(request.form.get('duration_days'))
         max_users = int(request.form.get('max_users'))
+        count = min(max(int(request.form.get('count', 1)), 1), MAX_CODE_BATCH)
         notes = request.form.get('notes', '')
         
-        # إنشاء كود جديد
-        code = generate_activation_code()
-        expires_at = datetime.utcnow() + timedelta(days=365)  # الكود صالح لمدة سنة
-        
-        activation_code = ActivationCode(
-            code=code,
-            duration_days=duration_days,
-            max_users=max_users,
-            creator_id=current_user.id,
-            expires_at=expires_at,
-            notes=notes
-        )
-        
-        db.session.add(activation_code)
-        db.session.commit()
+        # إنشاء الكودات
+        batch_id, codes = mint_codes(count, duration_days, max_users, current_user.id, notes)
         
-        system_log('code_creation', f'المطور {current_user.username} أنشأ الكود {code}')
-        flash(f'تم إنشاء الكود: {code}', 'success')
+        if count == 1:
+            system_log('code_creation', current_user.id, code=codes[0])
+            flash(f'تم إنشاء الكود: {codes[0]}', 'success')
+        else:
+            system_log('code_creation', current_user.id, count=count, batch_id=batch_id)
+            flash(f'تم إنشاء {count} كود في الدفعة {batch_id}', 'success')
         return redirect(url_for('manage_codes'))
     
-    codes = ActivationCode.query.order_by(ActivationCode.created_at.desc()).all()
-    return render_template('developer/codes.html', codes=codes)
+    codes, next_cursor = paginate_keyset(
+        ActivationCode.query.options(
+            db.joinedload(ActivationCode.creator),
+            db.selectinload(ActivationCode.activations).joinedload(Activation.user)
+        ),
+        ActivationCode
+    )
+    return render_template('developer/codes.html', 
+                         codes=codes, 
+                         next_cursor=next_cursor,
+                         stats=get_global_stats())
+
+@app.route('/api/developer/codes/batch', methods=['POST'])
+@login_required
+@developer_required
+def mint_codes_api():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'بيانات غير صالحة'}), 400
+    try:
+        count = int(data.get('count', 1))
+        duration_days = int(data['duration_days'])
+        max_users = int(data.get('max_users', 1))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'بيانات غير صالحة'}), 400
+    
+    if not 1 <= count <= MAX_CODE_BATCH:
+        return jsonify({'success': False, 'message': f'العدد يجب أن يكون بين 1 و {MAX_CODE_BATCH}'}), 400
+    if duration_days < 1:
+        return jsonify({'success': False, 'message': 'المدة يجب أن تكون يوماً واحداً على الأقل'}), 400
+    if max_users < 1:
+        return jsonify({'success': False, 'message': 'عدد المستخدمين يجب أن يكون 1 على الأقل'}), 400
+    
+    batch_id, codes = mint_codes(count, duration_days, max_users, current_user.id, data.get('notes', ''))
+    system_log('code_creation', current_user.id, count=count, batch_id=batch_id)
+    
+    return jsonify({
+        'success': True,
+        'batch_id': batch_id,
+        'codes': codes,
+        'export_url': url_for('export_codes', batch_id=batch_id)
+    })
+
+EXPORT_COLUMNS = ['code', 'duration_days', 'max_users', 'remaining_seats', 'status',
+                  'created_at', 'expires_at', 'notes', 'batch_id']
+
+@app.route('/api/developer/codes/export')
+@login_required
+@developer_required
+def export_codes():
+    """تصدير الكودات (CSV أو NDJSON) كتدفق بدون تحميل القائمة في الذاكرة"""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        abort(400)
+    
+    query = db.select(*(getattr(ActivationCode, column) for column in EXPORT_COLUMNS))
+    if request.args.get('batch_id'):
+        query = query.where(ActivationCode.batch_id == request.args['batch_id'])
+    if request.args.get('status'):
+        query = query.where(ActivationCode.status == request.args['status'])
+    query = query.order_by(ActivationCode.id).execution_options(yield_per=1000)
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(EXPORT_COLUMNS)
+        
+        for partition in db.session.execute(query).partitions():
+            for row in partition:
+                values = [value.isoformat() if isinstance(value, datetime) else value for value in row]
+                if export_format == 'csv':
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values)), ensure_ascii=False) + '\n')
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    filename = f"codes-{request.args.get('batch_id', 'all')}.{export_format}"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 @app.route('/developer/codes/<int:code_id>/delete')
 @login_required
@@ -361,7 +1165,7 @@ def delete_code(code_id):
     code.status = 'inactive'
     db.session.commit()
     
-    system_log('code_deletion', f'المطور {current_user.username} عطل الكود {code.code}')
+    system_log('code_deletion', current_user.id, code=code.code)
     flash('تم تعطيل الكود بنجاح!', 'success')
     return redirect(url_for('manage_codes'))
 
@@ -369,31 +1173,231 @@ def delete_code(code_id):
 @login_required
 @developer_required
 def manage_users():
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template('developer/users.html', users=users)
+    users, next_cursor = paginate_keyset(User.query, User)
+    return render_template('developer/users.html', users=users, next_cursor=next_cursor)
+
+def log_event_filter(event_column, legacy_column, labels, label):
+    """شرط التصفية بنوع السجل: رقم الحدث، أو النص للسجلات القديمة غير المرمزة"""
+    event = labels.get(label)
+    if event is None:
+        return legacy_column == label
+    return event_column == event.code
+
+def filtered_connection_logs():
+    """سجلات الاتصال حسب ?user_id= ?username= ?action= ?since= ?until="""
+    query = ConnectionLog.query.options(db.joinedload(ConnectionLog.user))
+    
+    user_id = request.args.get('user_id', type=int)
+    if request.args.get('username'):
+        user_id = db.session.query(User.id).filter_by(username=request.args['username']).scalar() or 0
+    if user_id is not None:
+        query = query.filter(ConnectionLog.user_id == user_id)
+    if request.args.get('action'):
+        query = query.filter(log_event_filter(ConnectionLog.event, ConnectionLog.legacy_action,
+                                              logevents.CONNECTION_BY_LABEL, request.args['action']))
+    
+    since, until = parse_datetime_arg('since'), parse_datetime_arg('until')
+    if since:
+        query = query.filter(ConnectionLog.timestamp >= since)
+    if until:
+        query = query.filter(ConnectionLog.timestamp < until)
+    
+    return paginate_keyset(query, ConnectionLog, 'timestamp', 'connection_cursor')
+
+def filtered_system_logs():
+    """سجلات النظام حسب ?log_type= ?since= ?until="""
+    query = SystemLog.query.options(db.joinedload(SystemLog.user))
+    if request.args.get('log_type'):
+        query = query.filter(log_event_filter(SystemLog.event, SystemLog.legacy_log_type,
+                                              logevents.SYSTEM_BY_LABEL, request.args['log_type']))
+    
+    since, until = parse_datetime_arg('since'), parse_datetime_arg('until')
+    if since:
+        query = query.filter(SystemLog.timestamp >= since)
+    if until:
+        query = query.filter(SystemLog.timestamp < until)
+    
+    return paginate_keyset(query, SystemLog, 'timestamp', 'system_cursor')
 
 @app.route('/developer/logs')
 @login_required
 @developer_required
 def view_logs():
-    system_logs = SystemLog.query.order_by(SystemLog.timestamp.desc()).limit(100).all()
-    connection_logs = ConnectionLog.query.order_by(ConnectionLog.timestamp.desc()).limit(100).all()
+    system_logs, system_cursor = filtered_system_logs()
+    connection_logs, connection_cursor = filtered_connection_logs()
     
     return render_template('developer/logs.html', 
                          system_logs=system_logs, 
-                         connection_logs=connection_logs)
+                         connection_logs=connection_logs,
+                         system_cursor=system_cursor,
+                         connection_cursor=connection_cursor)
+
+@app.route('/api/developer/logs')
+@login_required
+@developer_required
+def list_logs_api():
+    if request.args.get('kind', 'connection') == 'system':
+        logs, next_cursor = filtered_system_logs()
+        items = [serialize_system_log(log) for log in logs]
+    else:
+        logs, next_cursor = filtered_connection_logs()
+        items = [serialize_connection_log(log) for log in logs]
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@app.route('/api/developer/logs/search')
+@login_required
+@developer_required
+def search_logs_api():
+    """بحث نصي مرتب حسب الصلة في سجلات الاتصال (kind=connection) أو النظام (kind=system)"""
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'success': False, 'message': 'أدخل نص البحث'}), 400
+    
+    model, serialize = ConnectionLog, serialize_connection_log
+    if request.args.get('kind') == 'system':
+        model, serialize = SystemLog, serialize_system_log
+    
+    limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    page = max(1, request.args.get('page', 1, type=int))
+    offset = (page - 1) * limit
+    
+    query = model.query.options(db.joinedload(model.user))
+    
+    connection = db.session.connection()
+    if logsearch.available(connection):
+        hits = logsearch.search(connection, model.__tablename__, text, limit + 1, offset)
+        rows = {row.id: row for row in query.filter(model.id.in_([hit_id for hit_id, _ in hits[:limit]]))}
+        items = [dict(serialize(rows[hit_id]), score=score) for hit_id, score in hits[:limit] if hit_id in rows]
+        has_more = len(hits) > limit
+    else:
+        # بدون FTS5 (مثل Postgres): بحث LIKE مرتب بالأحدث في النص القديم ومعاملات
+        # السجلات المرمزة، واسم المستخدم ونص القوالب يتحولان لشرط على user_id والحدث
+        pattern = f'%{text}%'
+        columns = [model.__table__.c[column] for column in LOG_SEARCH_COLUMNS[model]
+                   if column in model.__table__.c] + [model.params]
+        conditions = [column.like(pattern) for column in columns]
+        conditions.append(model.user_id.in_(db.select(User.id).where(User.username.like(pattern))))
+        events = [event.code for event in logevents.matching_events(LOG_EVENTS[model], text)]
+        if events:
+            conditions.append(model.event.in_(events))
+        rows = query.filter(db.or_(*conditions)) \
+            .order_by(model.timestamp.desc()).limit(limit + 1).offset(offset).all()
+        items = [serialize(row) for row in rows[:limit]]
+        has_more = len(rows) > limit
+    
+    return jsonify({'items': items, 'page': page, 'has_more': has_more})
+
+@app.route('/api/developer/logs/archive')
+@login_required
+@developer_required
+def read_archived_logs():
+    """قراءة متدفقة (NDJSON) للسجلات المؤرشفة حسب ?kind= ?since= ?until= وحقول المساواة"""
+    if request.args.get('kind') == 'system':
+        model, fields, label_field = SystemLog, ('user_id',), 'log_type'
+    else:
+        model, fields, label_field = ConnectionLog, ('user_id',), 'action'
+    match = {field: request.args[field] for field in fields if request.args.get(field)}
+    label = request.args.get(label_field)
+    rows = logarchive.read(log_archive_dir, model.__tablename__,
+                           parse_datetime_arg('since'), parse_datetime_arg('until'), match)
+    usernames = {}
+    
+    def generate():
+        for row in rows:
+            row = render_archived_log(model, row, usernames)
+            if label and row[label_field] != label:
+                continue
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def render_archived_log(model, row, usernames):
+    """إضافة نص السجل لصف أرشيف مرمز، usernames ذاكرة مؤقتة لأسماء المستخدمين"""
+    if row.get('event') is None:
+        return row
+    user_id = row.get('user_id')
+    if user_id not in usernames:
+        usernames[user_id] = db.session.query(User.username).filter_by(id=user_id).scalar()
+    label, text, details = logevents.render(row['event'], row.get('params'), usernames[user_id])
+    if model is SystemLog:
+        rendered = {'log_type': label, 'message': text, 'details': details}
+    else:
+        rendered = {'action': label, 'details': text}
+    for key, value in rendered.items():
+        if row.get(key) is None:
+            row[key] = value
+    return row
+
+MAX_ANALYTICS_DAYS = 731
+
+@app.route('/api/developer/analytics')
+@login_required
+@developer_required
+def analytics_api():
+    """سلسلة يومية لمقياس من التجميعات حسب ?metric= ?since= ?until= ?dimension= ?top="""
+    metric = request.args.get('metric', 'redemptions')
+    if metric not in ROLLUPS:
+        return jsonify({'success': False, 'message': 'مقياس غير معروف', 'metrics': list(ROLLUPS)}), 400
+    
+    until = parse_datetime_arg('until')
+    until = until.date() if until else datetime.utcnow().date() + timedelta(days=1)
+    since = parse_datetime_arg('since')
+    since = since.date() if since else until - timedelta(days=30)
+    if not since < until <= since + timedelta(days=MAX_ANALYTICS_DAYS):
+        return jsonify({'success': False, 'message': f'المدة يجب أن تكون بين يوم و{MAX_ANALYTICS_DAYS} يوم'}), 400
+    
+    days, values = rollups.series(
+        db.session.connection(), metric, since, until,
+        dimensions=request.args.getlist('dimension'),
+        top=max(1, min(request.args.get('top', 10, type=int), 100))
+    )
+    return jsonify({
+        'metric': metric,
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'days': [day.isoformat() for day in days],
+        'series': {dimension or 'total': points for dimension, points in values.items()},
+        'totals': {dimension or 'total': sum(points) for dimension, points in values.items()}
+    })
+
+@app.route('/developer/metrics')
+@login_required
+@developer_required
+def developer_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/developer/metrics/slow')
+@login_required
+@developer_required
+def developer_slow_requests():
+    return jsonify({'slow_requests': metrics.slow_requests()})
 
 # --- إدارة البوتات ---
 
+def filtered_bots(user_id):
+    """بوتات المستخدم حسب ?status= ?region= و ?errors=1 (الأحدث خطأً أولاً)"""
+    query = BotAccount.query.filter_by(user_id=user_id)
+    region = request.args.get('region')
+    if region:
+        if region not in app.config.get('GAME_REGIONS', []):
+            abort(400)
+        query = query.filter(BotAccount.region == region)
+    if request.args.get('errors'):
+        query = query.filter(BotAccount.last_error_at.isnot(None))
+        return paginate_keyset(query, BotAccount, 'last_error_at')
+    return paginate_keyset(query, BotAccount)
+
 @app.route('/bots')
 @login_required
 @check_activation_required
 def manage_bots():
-    bots = BotAccount.query.filter_by(user_id=current_user.id).order_by(
-        BotAccount.created_at.desc()
-    ).all()
+    bots, next_cursor = filtered_bots(current_user.id)
     
-    return render_template('bots.html', bots=bots)
+    return render_template('bots.html', 
+                         bots=bots, 
+                         next_cursor=next_cursor,
+                         regions=app.config.get('GAME_REGIONS', []),
+                         status_counts=get_bot_status_counts(current_user.id))
 
 @app.route('/bots/add', methods=['GET', 'POST'])
 @login_required
@@ -403,22 +1407,28 @@ def add_bot():
         uid = request.form.get('uid')
         password = request.form.get('password')
         nickname = request.form.get('nickname', '')
+        region = request.form.get('region') or None
+        
+        if region and region not in app.config.get('GAME_REGIONS', []):
+            flash('المنطقة غير صحيحة!', 'danger')
+            return redirect(url_for('add_bot'))
         
         bot = BotAccount(
             user_id=current_user.id,
             uid=uid,
             password=password,
-            nickname=nickname
+            nickname=nickname,
+            region=region
         )
         
         db.session.add(bot)
         db.session.commit()
         
-        log_activity(current_user.id, 'إضافة بوت', f'UID: {uid}')
+        log_activity(current_user.id, 'bot_added', uid=uid)
         flash('تم إضافة البوت بنجاح!', 'success')
         return redirect(url_for('manage_bots'))
     
-    return render_template('add_bot.html')
+    return render_template('add_bot.html', regions=app.config.get('GAME_REGIONS', []))
 
 @app.route('/bots/<int:bot_id>/delete')
 @login_required
@@ -433,71 +1443,364 @@ def delete_bot(bot_id):
     db.session.delete(bot)
     db.session.commit()
     
-    log_activity(current_user.id, 'حذف بوت', f'UID: {bot.uid}')
+    log_activity(current_user.id, 'bot_deleted', uid=bot.uid)
     flash('تم حذف البوت بنجاح!', 'success')
     return redirect(url_for('manage_bots'))
 
+# --- العمليات الجماعية للمطور ---
+
+MAX_BULK_IDS = 10000
+
+def bulk_user_conditions(criteria):
+    conditions = [User.is_developer.is_(False), User.id != current_user.id]
+    if 'status' in criteria:
+        conditions.append(User.status == criteria['status'])
+    if 'username_prefix' in criteria:
+        conditions.append(User.username.startswith(criteria['username_prefix'], autoescape=True))
+    if 'last_login_before' in criteria:
+        conditions.append(db.or_(User.last_login.is_(None), User.last_login < criteria['last_login_before']))
+    return conditions
+
+def bulk_code_conditions(criteria):
+    conditions = []
+    for field in ('status', 'batch_id', 'duration_days', 'creator_id'):
+        if field in criteria:
+            conditions.append(getattr(ActivationCode, field) == criteria[field])
+    if criteria.get('unused'):
+        conditions.append(ActivationCode.remaining_seats == ActivationCode.max_users)
+    return conditions
+
+def bulk_bot_conditions(criteria):
+    conditions = []
+    for field in ('user_id', 'status', 'region'):
+        if field in criteria:
+            conditions.append(getattr(BotAccount, field) == criteria[field])
+    if criteria.get('has_error'):
+        conditions.append(BotAccount.last_error_at.isnot(None))
+    return conditions
+
+# الكيان -> (النموذج، شروط المعايير، المعايير المسموحة، العمليات: القيم الجديدة أو None للحذف)
+BULK_TARGETS = {
+    'users': (User, bulk_user_conditions,
+              {'status': str, 'username_prefix': str, 'last_login_before': datetime.fromisoformat},
+              {'disable': {'status': 'banned'}, 'enable': {'status': 'active'}}),
+    'codes': (ActivationCode, bulk_code_conditions,
+              {'status': str, 'batch_id': str, 'duration_days': int, 'creator_id': int, 'unused': bool},
+              {'disable': {'status': 'inactive'}, 'enable': {'status': 'active'}}),
+    'bots': (BotAccount, bulk_bot_conditions,
+             {'user_id': int, 'status': str, 'region': str, 'has_error': bool},
+             {'delete': None}),
+}
+
+def parse_bulk_criteria(allowed, payload):
+    """معايير العملية من جسم الطلب: ids أو filter، يرمي ValueError إذا كانت غير صالحة"""
+    criteria = {}
+    if payload.get('ids') is not None:
+        ids = payload['ids']
+        if not isinstance(ids, list) or len(ids) > MAX_BULK_IDS:
+            raise ValueError(f'ids يجب أن تكون قائمة حتى {MAX_BULK_IDS} معرف')
+        criteria['ids'] = sorted({int(item_id) for item_id in ids})
+    for field, value in (payload.get('filter') or {}).items():
+        if field not in allowed:
+            raise ValueError(f'معيار غير معروف: {field}')
+        criteria[field] = allowed[field](value)
+    if not criteria:
+        raise ValueError('حدد ids أو filter')
+    return criteria
+
+def apply_bulk_chunk(model, values, ids):
+    """تطبيق العملية على دفعة معرفات بعبارة واحدة، يعيد عدد الصفوف المتأثرة"""
+    session = db.session
+    if model is BotAccount:
+        owners = {user_id for (user_id,) in session.query(BotAccount.user_id)
+                  .filter(BotAccount.id.in_(ids)).distinct()}
+        session.execute(db.delete(BotJob).where(BotJob.bot_id.in_(ids))
+                        .execution_options(synchronize_session=False))
+        affected = session.execute(db.delete(BotAccount).where(BotAccount.id.in_(ids))
+                                   .execution_options(synchronize_session=False)).rowcount
+        adjust_counter(session.connection(), 'total_bots', -affected)
+        session.info.setdefault('bots_changed', set()).update(owners)
+        return affected
+    
+    affected = session.execute(
+        db.update(model).where(model.id.in_(ids), model.status != values['status'])
+        .values(**values).execution_options(synchronize_session=False)
+    ).rowcount
+    if model is ActivationCode:
+        adjust_counter(session.connection(), 'active_codes',
+                       affected if values['status'] == 'active' else -affected)
+    elif model is User:
+        session.info.setdefault('identity_changed', set()).update(ids)
+    return affected
+
+def run_bulk_operation(entity, operation, criteria, dry_run=False):
+    """تنفيذ عملية جماعية على دفعات من BULK_CHUNK_SIZE في معاملة واحدة، يعيد العدد المتأثر"""
+    model, build_conditions, _, operations = BULK_TARGETS[entity]
+    values = operations[operation]
+    conditions = build_conditions(criteria)
+    if 'ids' in criteria:
+        conditions.append(model.id.in_(criteria['ids']))
+    if values is not None:
+        # الصفوف التي عليها الحالة الجديدة أصلاً لا تحسب
+        conditions.append(model.status != values['status'])
+    
+    chunk_size = app.config.get('BULK_CHUNK_SIZE', 1000)
+    affected, last_id = 0, 0
+    try:
+        while True:
+            ids = [item_id for (item_id,) in db.session.query(model.id)
+                   .filter(*conditions, model.id > last_id).order_by(model.id).limit(chunk_size)]
+            if not ids:
+                break
+            last_id = ids[-1]
+            affected += len(ids) if dry_run else apply_bulk_chunk(model, values, ids)
+        
+        if dry_run or not affected:
+            db.session.rollback()
+            return affected
+        db.session.info['site_pages_changed'] = True
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return affected
+
+@app.route('/api/developer/bulk/<entity>/<operation>', methods=['POST'])
+@login_required
+@developer_required
+def bulk_operation_api(entity, operation):
+    """عملية جماعية: {"ids": [...]} و/أو {"filter": {...}}، و "dry_run": true للعد فقط"""
+    if entity not in BULK_TARGETS or operation not in BULK_TARGETS[entity][3]:
+        return jsonify({'success': False, 'message': 'عملية غير معروفة'}), 404
+    
+    payload = request.get_json(silent=True) or {}
+    try:
+        criteria = parse_bulk_criteria(BULK_TARGETS[entity][2], payload)
+    except (TypeError, ValueError) as exc:
+        return jsonify({'success': False, 'message': str(exc)}), 400
+    
+    dry_run = bool(payload.get('dry_run'))
+    started = time.perf_counter()
+    affected = run_bulk_operation(entity, operation, criteria, dry_run)
+    
+    if affected and not dry_run:
+        summary = ', '.join(f'{field}={len(value) if field == "ids" else value}'
+                            for field, value in criteria.items())
+        system_log('bulk_operation', current_user.id, entity=entity, operation=operation,
+                   count=affected, criteria=summary)
+    
+    return jsonify({
+        'success': True,
+        'entity': entity,
+        'operation': operation,
+        'dry_run': dry_run,
+        'affected': affected,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    })
+
 # --- ميزات السورس الرئيسي ---
 
 @app.route('/features/invite')
 @login_required
 @check_activation_required
+@cached_page('user')
 def invite_feature():
     return render_template('features/invite.html')
 
 @app.route('/features/join')
 @login_required
 @check_activation_required
+@cached_page('user')
 def join_feature():
     return render_template('features/join.html')
 
 @app.route('/features/messages')
 @login_required
 @check_activation_required
+@cached_page('user')
 def messages_feature():
     return render_template('features/messages.html')
 
 @app.route('/features/squad')
 @login_required
 @check_activation_required
+@cached_page('user')
 def squad_feature():
     return render_template('features/squad.html')
 
 @app.route('/features/player-info')
 @login_required
 @check_activation_required
+@cached_page('user')
 def player_info_feature():
     return render_template('features/player_info.html')
 
 # --- API للميزات ---
 
+@app.route('/api/bots')
+@login_required
+@check_activation_required
+def list_bots_api():
+    bots, next_cursor = filtered_bots(current_user.id)
+    return jsonify({'items': [serialize_bot(bot) for bot in bots], 'next_cursor': next_cursor})
+
+@app.route('/api/developer/codes')
+@login_required
+@developer_required
+def list_codes_api():
+    codes, next_cursor = paginate_keyset(ActivationCode.query, ActivationCode)
+    return jsonify({'items': [serialize_code(code) for code in codes], 'next_cursor': next_cursor})
+
+@app.route('/api/developer/users')
+@login_required
+@developer_required
+def list_users_api():
+    users, next_cursor = paginate_keyset(User.query, User)
+    return jsonify({'items': [serialize_user(user) for user in users], 'next_cursor': next_cursor})
+
+def user_events(user_id, state):
+    """أحداث المستخدم منذ آخر استدعاء كأزواج (النوع، البيانات)
+
+    state يحفظ آخر ما أرسل: حالة كل بوت، الإحصائيات، وآخر معرف سجل.
+    """
+    events = []
+    
+    bots = {bot_id: (status, last_activity) for bot_id, status, last_activity in
+            db.session.query(BotAccount.id, BotAccount.status, BotAccount.last_activity)
+            .filter(BotAccount.user_id == user_id)}
+    for bot_id, (status, last_activity) in bots.items():
+        if state['bots'].get(bot_id) != (status, last_activity):
+            events.append(('bot', {
+                'id': bot_id,
+                'status': status,
+                'last_activity': last_activity.isoformat() if last_activity else None
+            }))
+    for bot_id in state['bots'].keys() - bots.keys():
+        events.append(('bot', {'id': bot_id, 'deleted': True}))
+    state['bots'] = bots
+    
+    stats = get_user_stats(user_id)
+    stats['status_counts'] = get_bot_status_counts(user_id)
+    active_until = get_active_until(user_id)
+    stats['active_until'] = active_until.isoformat() if active_until else None
+    if stats != state.get('stats'):
+        events.append(('stats', stats))
+        state['stats'] = stats
+    
+    logs = ConnectionLog.query.filter(
+        ConnectionLog.user_id == user_id, ConnectionLog.id > state['last_log_id']
+    ).order_by(ConnectionLog.id).limit(PAGE_SIZE).all()
+    for log in logs:
+        events.append(('log', serialize_connection_log(log)))
+        state['last_log_id'] = log.id
+    
+    return events
+
+@app.route('/api/events')
+@login_required
+def event_stream():
+    """بث Server-Sent Events لحالة البوتات والإحصائيات والنشاطات الجديدة
+
+    الاستعلامات تنفذ فقط عند إشعار من change_bus، وبين الإشعارات يرسل
+    تعليق keepalive. Last-Event-ID يستأنف السجلات من آخر سجل وصل.
+    """
+    user_id = current_user.id
+    last_log_id = request.headers.get('Last-Event-ID', type=int)
+    if last_log_id is None:
+        last_log_id = db.session.query(db.func.max(ConnectionLog.id)).filter(
+            ConnectionLog.user_id == user_id
+        ).scalar() or 0
+    
+    keepalive = app.config.get('EVENTS_KEEPALIVE', 15)
+    ends_at = time.monotonic() + app.config.get('EVENTS_MAX_DURATION', 300)
+    
+    def generate():
+        state = {'bots': {}, 'last_log_id': last_log_id}
+        generation = None
+        yield 'retry: 3000\n\n'
+        
+        while time.monotonic() < ends_at:
+            current = change_bus.generation(user_id)
+            if current == generation:
+                yield ': keepalive\n\n'
+            else:
+                generation = current
+                for kind, data in user_events(user_id, state):
+                    event_id = f"id: {data['id']}\n" if kind == 'log' else ''
+                    yield f'{event_id}event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+                # لا نحجز اتصالاً بقاعدة البيانات أثناء الانتظار
+                db.session.close()
+            change_bus.wait(user_id, generation, min(keepalive, max(0, ends_at - time.monotonic())))
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def enqueue_bot_jobs(action):
+    """إضافة أمر لكل بوت من bot_ids يملكه المستخدم، الأمر المعلق لنفس البوت لا يكرر"""
+    data = request.get_json(silent=True) or {}
+    bot_ids = [int(bot_id) for bot_id in data.get('bot_ids', []) if str(bot_id).isdigit()]
+    
+    query = db.session.query(BotAccount.id).filter(BotAccount.id.in_(bot_ids))
+    if not current_user.is_developer:
+        query = query.filter(BotAccount.user_id == current_user.id)
+    owned = [bot_id for (bot_id,) in query]
+    
+    pending = {job.bot_id: job for job in BotJob.query.filter(
+        BotJob.bot_id.in_(owned), BotJob.action == action, BotJob.status.in_(('queued', 'running'))
+    )}
+    jobs = []
+    for bot_id in owned:
+        job = pending.get(bot_id)
+        if job is None:
+            job = BotJob(bot_id=bot_id, user_id=current_user.id, action=action)
+            db.session.add(job)
+        jobs.append(job)
+    db.session.commit()
+    
+    bot_workers.notify(len(jobs))
+    return jobs
+
 @app.route('/api/bots/start', methods=['POST'])
 @login_required
 @check_activation_required
 def start_bots():
-    data = request.json
-    bot_ids = data.get('bot_ids', [])
-    
-    # هنا سيتم دمج كود تشغيل البوتات من السورس الأصلي
-    # مؤقتاً نعيد رسالة نجاح
+    jobs = enqueue_bot_jobs('start')
     return jsonify({
         'success': True,
-        'message': f'تم بدء تشغيل {len(bot_ids)} بوت',
-        'started': bot_ids
-    })
+        'message': f'تمت جدولة تشغيل {len(jobs)} بوت',
+        'started': [job.bot_id for job in jobs],
+        'jobs': [serialize_bot_job(job) for job in jobs]
+    }), 202
 
 @app.route('/api/bots/stop', methods=['POST'])
 @login_required
 @check_activation_required
 def stop_bots():
-    data = request.json
-    bot_ids = data.get('bot_ids', [])
-    
+    jobs = enqueue_bot_jobs('stop')
     return jsonify({
         'success': True,
-        'message': f'تم إيقاف {len(bot_ids)} بوت',
-        'stopped': bot_ids
-    })
+        'message': f'تمت جدولة إيقاف {len(jobs)} بوت',
+        'stopped': [job.bot_id for job in jobs],
+        'jobs': [serialize_bot_job(job) for job in jobs]
+    }), 202
+
+@app.route('/api/bots/jobs')
+@login_required
+def bot_jobs_status():
+    """حالة أوامر البوتات حسب ?ids=1,2,3 (للاستطلاع بعد start/stop)"""
+    job_ids = [int(job_id) for job_id in request.args.get('ids', '').split(',') if job_id.isdigit()]
+    query = BotJob.query.filter(BotJob.id.in_(job_ids[:MAX_PAGE_SIZE]))
+    if not current_user.is_developer:
+        query = query.filter(BotJob.user_id == current_user.id)
+    return jsonify({'jobs': [serialize_bot_job(job) for job in query.order_by(BotJob.id)]})
+
+@app.route('/api/bots/jobs/<int:job_id>')
+@login_required
+def bot_job_status(job_id):
+    job = BotJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id and not current_user.is_developer:
+        abort(404)
+    return jsonify(serialize_bot_job(job))
 
 @app.route('/api/invite/send', methods=['POST'])
 @login_required
@@ -508,7 +1811,7 @@ def send_invite():
     message = data.get('message', '')
     
     # هنا سيتم دمج كود إرسال الدعوة من السورس الأصلي
-    log_activity(current_user.id, 'إرسال دعوة', f'لـ Player ID: {player_id}')
+    log_activity(current_user.id, 'invite_sent', player_id=player_id)
     
     return jsonify({
         'success': True,
@@ -516,35 +1819,547 @@ def send_invite():
         'timestamp': datetime.utcnow().isoformat()
     })
 
-# --- خدمة الخلفية لفحص الصلاحيات ---
+# --- المهام الدورية ---
+
+# تعمل في عملية واحدة فقط (قائد ينتخب عبر قاعدة البيانات) سواء من عمال
+# gunicorn أو من flask run-jobs
+job_scheduler = scheduler.JobScheduler(
+    lambda: db.engine,
+    app.app_context,
+    lease_ttl=app.config.get('SCHEDULER_LEASE_TTL', 30),
+    poll_interval=app.config.get('SCHEDULER_POLL_INTERVAL', 5)
+)
 
+@app.before_request
+def start_background_workers():
+    if app.config.get('SCHEDULER_IN_PROCESS', True):
+        job_scheduler.start()
+        bot_workers.start()
+
+@job_scheduler.job('expire-activations', interval=app.config.get('EXPIRY_CHECK_INTERVAL', 300))
 def check_expired_activations():
-    """فحص المستخدمين المنتهية صلاحيتهم"""
+    """فحص المستخدمين المنتهية صلاحيتهم، يعيد موعد الانتهاء التالي"""
     with app.app_context():
-        expired = Activation.query.filter(
-            Activation.status == 'active',
-            Activation.expires_at <= datetime.utcnow()
-        ).all()
+        now = datetime.utcnow()
+        due = db.and_(Activation.status == 'active', Activation.expires_at <= now)
         
-        for activation in expired:
-            activation.status = 'expired'
+        user_ids = [user_id for (user_id,) in db.session.query(Activation.user_id).filter(due).distinct()]
+        
+        if user_ids:
+            # سجل واحد لكل تفعيل منتهي في إدراج واحد
+            system_logs = SystemLog.__table__
+            db.session.execute(system_logs.insert().from_select(
+                ['user_id', 'event', 'params', 'timestamp'],
+                db.select(
+                    Activation.user_id,
+                    db.literal(logevents.SYSTEM_BY_NAME['expiration'].code),
+                    # الأكواد المولدة حروف وأرقام وشرطات فقط فلا تحتاج تهريباً في JSON
+                    db.literal('{"code":"') + ActivationCode.code + db.literal('"}'),
+                    db.literal(now)
+                ).select_from(Activation)
+                .outerjoin(ActivationCode, ActivationCode.id == Activation.code_id)
+                .where(due)
+            ))
+            
+            # إعادة مقاعد التفعيلات المنتهية لأكوادها
+            released = db.select(db.func.count(Activation.id)).where(
+                due, Activation.code_id == ActivationCode.id
+            ).scalar_subquery()
+            db.session.execute(
+                db.update(ActivationCode)
+                .where(ActivationCode.id.in_(db.select(Activation.code_id).where(due)))
+                .values(remaining_seats=ActivationCode.remaining_seats + released)
+                .execution_options(synchronize_session=False)
+            )
             
-            # تسجيل الخروج للمستخدم إذا كان متصل
-            user = activation.user
-            if user:
-                system_log('expiration', 
-                          f'انتهت صلاحية المستخدم {user.username}',
-                          f'الكود: {activation.activation_code.code}')
-        
-        if expired:
+            expired = db.session.execute(
+                db.update(Activation).where(due).values(status='expired')
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.info['site_pages_changed'] = True
             db.session.commit()
-            print(f"[{datetime.utcnow()}] تم تحديث {len(expired)} مستخدم منتهي الصلاحية")
+            
+            for user_id in user_ids:
+                subscription_cache.invalidate(user_id)
+                change_bus.publish(user_id)
+            print(f"[{datetime.utcnow()}] تم تحديث {expired} مستخدم منتهي الصلاحية")
+        
+        return db.session.query(db.func.min(Activation.expires_at)).filter(
+            Activation.status == 'active',
+            Activation.expires_at > now
+        ).scalar()
+
+# --- تنفيذ أوامر البوتات في الخلفية ---
+
+def run_bot_action(action, bot_id):
+    """تنفيذ أمر بوت، يعيد (حالة البوت الجديدة، بيانات الاتصال أو None)
+
+    بيانات الاتصال (مثل region و last_error من خادم اللعبة) تحفظ بـ
+    set_connection_data. هنا سيتم دمج كود تشغيل البوتات من السورس الأصلي،
+    مؤقتاً منفذ تجريبي ينتظر BOT_STUB_DELAY ثانية ولا يعيد بيانات اتصال.
+    """
+    time.sleep(app.config.get('BOT_STUB_DELAY', 2.0))
+    return ('active' if action == 'start' else 'inactive'), None
+
+def claim_bot_job():
+    """حجز أقدم أمر في الطابور ما دام عدد الأوامر الجارية أقل من BOT_JOB_CONCURRENCY"""
+    with app.app_context():
+        running = db.select(db.func.count(BotJob.id)).where(BotJob.status == 'running').scalar_subquery()
+        for _ in range(3):
+            job_id = db.session.query(BotJob.id).filter(BotJob.status == 'queued') \
+                .order_by(BotJob.id).limit(1).scalar()
+            if job_id is None:
+                return None
+            claimed = db.session.execute(
+                db.update(BotJob)
+                .where(BotJob.id == job_id, BotJob.status == 'queued',
+                       running < app.config.get('BOT_JOB_CONCURRENCY', 16))
+                .values(status='running', started_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return job_id
+        return None
+
+def execute_bot_job(job_id):
+    with app.app_context():
+        job = db.session.get(BotJob, job_id)
+        if job is None or job.status != 'running':
+            return
+        action, bot_id = job.action, job.bot_id
+        # لا نحجز اتصالاً بقاعدة البيانات أثناء تنفيذ الأمر
+        db.session.rollback()
+        
+        connection_data = None
+        try:
+            (status, connection_data), error = run_bot_action(action, bot_id), None
+        except Exception as exc:
+            app.logger.exception('فشل أمر البوت %s', job_id)
+            status, error = 'error', str(exc)
+        
+        now = datetime.utcnow()
+        job = db.session.get(BotJob, job_id)
+        if job is None:
+            return
+        job.status = 'failed' if error else 'succeeded'
+        job.error = error
+        job.finished_at = now
+        job.bot.status = status
+        job.bot.last_activity = now
+        if connection_data is not None:
+            job.bot.set_connection_data(connection_data)
+        if error:
+            job.bot.last_error = error[:500]
+            job.bot.last_error_at = now
+        elif 'last_error' not in (connection_data or {}):
+            # البوت الذي نجح أمره لم يعد يظهر في قوائم الأخطاء، إلا إذا أبلغ خادم اللعبة بخطأ
+            job.bot.last_error = None
+            job.bot.last_error_at = None
+        db.session.commit()
+
+bot_workers = WorkerPool(
+    claim_bot_job,
+    execute_bot_job,
+    workers=app.config.get('BOT_JOB_WORKERS', 4),
+    name='bot-worker'
+)
+
+@job_scheduler.job('requeue-bot-jobs', interval=60)
+def requeue_stale_bot_jobs():
+    """إعادة الأوامر العالقة (ماتت عمليتها أثناء التنفيذ) إلى الطابور"""
+    with app.app_context():
+        timeout = timedelta(seconds=app.config.get('BOT_JOB_TIMEOUT', 600))
+        requeued = db.session.execute(
+            db.update(BotJob)
+            .where(BotJob.status == 'running', BotJob.started_at < datetime.utcnow() - timeout)
+            .values(status='queued', started_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if requeued:
+            bot_workers.notify(requeued)
+
+# --- أرشفة السجلات القديمة ---
+
+log_archive_dir = app.config['LOG_ARCHIVE_DIR'] or os.path.join(app.instance_path, 'archive')
+
+@job_scheduler.job('archive-logs', interval=app.config.get('LOG_ARCHIVE_INTERVAL', 24 * 3600))
+def archive_old_logs(days=None):
+    """نقل السجلات الأقدم من LOG_RETENTION_DAYS إلى الأرشيف، يعيد العدد لكل جدول"""
+    days = app.config['LOG_RETENTION_DAYS'] if days is None else days
+    before = datetime.utcnow() - timedelta(days=days)
+    with app.app_context():
+        return {
+            model.__tablename__: logarchive.archive_table(
+                db.engine, model.__table__, before, log_archive_dir,
+                app.config['LOG_ARCHIVE_BATCH'], app.config['LOG_ARCHIVE_PAUSE'])
+            for model in (ConnectionLog, SystemLog)
+        }
+
+@app.cli.command('archive-logs')
+@click.option('--days', type=int, default=None, help='عمر السجلات المؤرشفة بالأيام (الافتراضي LOG_RETENTION_DAYS)')
+def archive_logs_command(days):
+    """نقل السجلات القديمة إلى ملفات NDJSON مضغوطة"""
+    for table, moved in archive_old_logs(days).items():
+        click.echo(f'{table}: تمت أرشفة {moved} سجل')
+
+# --- ترميز السجلات النصية القديمة ---
+
+def encode_log_rows(model, rows, find_users):
+    """قيم التحديث لدفعة سجلات نصية قديمة
+
+    سجلات النظام القديمة لا تحفظ user_id، فيستخرج اسم المستخدم من النص
+    ويبحث عنه بـ find_users(أسماء) -> {اسم: معرف}. النص القديم يحذف فقط
+    إذا أعاد القالب بناءه حرفياً من المعاملات، وإلا يبقى كما هو مع رقم الحدث.
+    """
+    system = model is SystemLog
+    labels = logevents.SYSTEM_BY_LABEL if system else logevents.CONNECTION_BY_LABEL
+    fields = ('log_type', 'message', 'details') if system else ('action', 'details')
+    
+    parsed = []
+    for row in rows:
+        event = labels.get(row[fields[0]])
+        if event is None:
+            continue
+        templates = dict(zip(fields[1:], (event.text, event.details)))
+        values = {field: logevents.parse(templates[field], row[field]) for field in fields[1:]}
+        parsed.append((row, event, values))
+    
+    names = {values.get('username') for _, _, fields_values in parsed
+             for values in fields_values.values() if values}
+    user_ids = find_users(names - {None}) if system and names - {None} else {}
+    
+    updates = []
+    for row, event, fields_values in parsed:
+        user_id, username = row['user_id'], row['username']
+        params = {}
+        for values in fields_values.values():
+            if values is None:
+                continue
+            found = values.pop('username', None)
+            if found is not None and username is None and found in user_ids:
+                user_id, username = user_ids[found], found
+            if found is None or found == username:
+                params.update(values)
+        
+        params = logevents.encode_params(params)
+        rendered = dict(zip(fields, logevents.render(event.code, params, username)))
+        update = {'_id': row['id'], '_user_id': user_id, '_event': event.code, '_params': params,
+                  '_' + fields[0]: None}
+        for field in fields[1:]:
+            text = row[field]
+            update['_' + field] = None if rendered[field] == (text or '') else text
+        updates.append(update)
+    return updates
+
+@job_scheduler.job('encode-logs', interval=app.config.get('LOG_ARCHIVE_INTERVAL', 24 * 3600))
+def encode_legacy_logs(batch_size=None):
+    """تحويل السجلات النصية القديمة إلى رقم حدث ومعاملات، يعيد العدد لكل جدول"""
+    batch_size = batch_size or app.config['LOG_ENCODE_BATCH']
+    encoded = {}
+    with app.app_context():
+        for model in (ConnectionLog, SystemLog):
+            table = model.__table__
+            fields = ['log_type', 'message', 'details'] if model is SystemLog else ['action', 'details']
+            statement = table.update().where(table.c.id == db.bindparam('_id')).values(
+                user_id=db.bindparam('_user_id'), event=db.bindparam('_event'),
+                params=db.bindparam('_params'),
+                **{field: db.bindparam('_' + field) for field in fields})
+            
+            last_id, total = 0, 0
+            while True:
+                with db.engine.begin() as connection:
+                    rows = connection.execute(
+                        db.select(table.c.id, table.c.user_id, User.username.label('username'),
+                                  *(table.c[field] for field in fields))
+                        .outerjoin(User, User.id == table.c.user_id)
+                        .where(table.c.event.is_(None), table.c.id > last_id)
+                        .order_by(table.c.id).limit(batch_size)
+                    ).mappings().all()
+                    if not rows:
+                        break
+                    updates = encode_log_rows(model, rows, lambda names: dict(connection.execute(
+                        db.select(User.username, User.id).where(User.username.in_(names))).all()))
+                    if updates:
+                        connection.execute(statement, updates)
+                last_id = rows[-1]['id']
+                total += len(updates)
+                time.sleep(app.config['LOG_ENCODE_PAUSE'])
+            if total:
+                with db.engine.begin() as connection:
+                    logsearch.optimize(connection, model.__tablename__)
+            encoded[model.__tablename__] = total
+    return encoded
+
+@app.cli.command('encode-logs')
+@click.option('--batch-size', type=int, default=None, help='صفوف كل دفعة (الافتراضي LOG_ENCODE_BATCH)')
+def encode_logs_command(batch_size):
+    """تحويل السجلات النصية القديمة إلى الترميز المختصر (يمكن إيقافه واستئنافه)"""
+    for table, count in encode_legacy_logs(batch_size).items():
+        click.echo(f'{table}: تم ترميز {count} سجل')
+
+# --- التجميعات اليومية للإحصائيات ---
+
+activations_table, codes_table, logs_table = Activation.__table__, ActivationCode.__table__, ConnectionLog.__table__
+
+ROLLUPS = {rollup.metric: rollup for rollup in (
+    rollups.Rollup('registrations', User.__table__, User.__table__.c.created_at),
+    rollups.Rollup('redemptions', activations_table, activations_table.c.activated_at),
+    rollups.Rollup('redemptions_by_plan', activations_table, activations_table.c.activated_at,
+                   dimension=codes_table.c.duration_days,
+                   select_from=activations_table.join(codes_table)),
+    rollups.Rollup('redemptions_by_code', activations_table, activations_table.c.activated_at,
+                   dimension=codes_table.c.code,
+                   select_from=activations_table.join(codes_table)),
+    rollups.Rollup('connection_events', logs_table, logs_table.c.timestamp,
+                   dimension=db.case({event.code: event.name for event in logevents.CONNECTION_EVENTS},
+                                     value=logs_table.c.event, else_=logs_table.c.action),
+                   archived=True),
+)}
+
+@job_scheduler.job('rollups', interval=app.config.get('ROLLUP_INTERVAL', 60))
+def update_rollups():
+    """إضافة الصفوف الجديدة للتجميعات اليومية، يعيد عدد الصفوف لكل مقياس"""
+    with app.app_context():
+        return {metric: rollups.update(db.engine, rollup, app.config['ROLLUP_BATCH'])
+                for metric, rollup in ROLLUPS.items()}
+
+@app.cli.command('update-rollups')
+def update_rollups_command():
+    """تحديث التجميعات اليومية بالصفوف الجديدة"""
+    for metric, count in update_rollups().items():
+        click.echo(f'{metric}: {count} صف جديد')
+
+@app.cli.command('rebuild-rollups')
+@click.option('--since', type=click.DateTime(['%Y-%m-%d']), required=True)
+@click.option('--until', type=click.DateTime(['%Y-%m-%d']), default=None, help='حتى (غير شامل)، الافتراضي الغد')
+@click.option('--metric', multiple=True, help='مقياس محدد (الافتراضي كل المقاييس)')
+def rebuild_rollups_command(since, until, metric):
+    """إعادة حساب أيام التجميعات من الجداول"""
+    until = until.date() if until else datetime.utcnow().date() + timedelta(days=1)
+    for name in metric or ROLLUPS:
+        if name not in ROLLUPS:
+            raise click.BadParameter(f'مقياس غير معروف: {name}', param_hint='--metric')
+        rebuilt = rollups.rebuild(db.engine, ROLLUPS[name], since.date(), until)
+        if rebuilt:
+            click.echo(f'{name}: أعيد بناء {rebuilt[0]} حتى {rebuilt[1]}')
+        else:
+            click.echo(f'{name}: لا توجد أيام في المصدر ضمن المدة')
+
+# --- ترحيل المخطط ---
+
+@migrations.migration(1, 'فهارس الاستعلامات المتكررة')
+def add_hot_query_indexes(connection, metadata):
+    migrations.create_missing_indexes(connection, metadata)
+
+@migrations.migration(2, 'فهارس الترقيم بالمؤشر')
+def add_pagination_indexes(connection, metadata):
+    migrations.create_missing_indexes(connection, metadata)
+
+@migrations.migration(3, 'عداد المقاعد المتبقية لكل كود')
+def add_remaining_seats(connection, metadata):
+    codes = ActivationCode.__table__
+    migrations.add_column(connection, codes, codes.c.remaining_seats)
+    
+    used = db.select(db.func.count(Activation.id)).where(
+        Activation.code_id == codes.c.id,
+        Activation.status == 'active'
+    ).scalar_subquery()
+    connection.execute(codes.update().values(remaining_seats=codes.c.max_users - used))
+
+@migrations.migration(4, 'رقم دفعة الكودات')
+def add_code_batch_id(connection, metadata):
+    codes = ActivationCode.__table__
+    migrations.add_column(connection, codes, codes.c.batch_id)
+    migrations.create_missing_indexes(connection, metadata)
+
+@migrations.migration(5, 'فهارس تصفية السجلات')
+def add_log_filter_indexes(connection, metadata):
+    migrations.create_missing_indexes(connection, metadata)
+
+@migrations.migration(6, 'فهرس البحث النصي في السجلات')
+def add_log_search(connection, metadata):
+    # الأعمدة كما كانت قبل الترحيل 8
+    for table, columns in (('connection_log', ('action', 'details')),
+                           ('system_log', ('log_type', 'message', 'details'))):
+        logsearch.install(connection, table, columns, rebuild=True)
+
+@migrations.migration(7, 'جداول أوامر البوتات والمهام المجدولة')
+def add_job_tables(connection, metadata):
+    metadata.create_all(connection, checkfirst=True)
+    scheduler.create_tables(connection)
+
+@migrations.migration(8, 'ترميز السجلات برقم الحدث ومعاملاته')
+def add_log_event_columns(connection, metadata):
+    # تحويل الصفوف الموجودة على دفعات بعدها: flask encode-logs (أو مهمة encode-logs)
+    for model, columns in ((ConnectionLog, ('event', 'params')), (SystemLog, ('user_id', 'event', 'params'))):
+        table = model.__table__
+        for column in columns:
+            migrations.add_column(connection, table, table.c[column])
+    for index in ('ix_connection_log_action_timestamp', 'ix_system_log_type_timestamp'):
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS {index}')
+    migrations.create_missing_indexes(connection, metadata)
+    # فهرس البحث على الأعمدة القديمة لا يجد السجلات المرمزة، يعاد بناؤه في الترحيل 11
+    for model in LOG_SEARCH_COLUMNS:
+        logsearch.uninstall(connection, model.__tablename__)
+
+@migrations.migration(9, 'جداول التجميعات اليومية')
+def add_rollup_tables(connection, metadata):
+    # تملأ تدريجياً بمهمة rollups (أو flask update-rollups)
+    rollups.create_tables(connection)
+
+@migrations.migration(10, 'أعمدة المنطقة وآخر خطأ للبوتات وبيانات الاتصال المضغوطة')
+def add_bot_connection_columns(connection, metadata):
+    bots = BotAccount.__table__
+    for column in ('region', 'last_error', 'last_error_at', 'connection_blob'):
+        migrations.add_column(connection, bots, bots.c[column])
+    migrations.create_missing_indexes(connection, metadata)
+    
+    if 'connection_data' not in {column['name'] for column in db.inspect(connection).get_columns('bot_account')}:
+        return
+    legacy = db.table('bot_account', db.column('id'), db.column('connection_data'))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            db.select(legacy.c.id, legacy.c.connection_data)
+            .where(legacy.c.id > last_id, legacy.c.connection_data.isnot(None))
+            .order_by(legacy.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        for bot_id, text in rows:
+            try:
+                data = json.loads(text)
+            except ValueError:
+                data = {'raw': text}
+            if not isinstance(data, dict):
+                data = {'raw': data}
+            promoted, rest = split_connection_data(data)
+            promoted = {field: str(value)[:500] if value is not None else None for field, value in promoted.items()}
+            connection.execute(bots.update().where(bots.c.id == bot_id)
+                               .values(connection_blob=rest or None, **promoted))
+        last_id = rows[-1].id
+    
+    # DROP COLUMN يحتاج SQLite 3.35، وإلا يبقى العمود القديم فارغاً
+    connection.execute(legacy.update().values(connection_data=None))
+    if connection.dialect.name != 'sqlite' or sqlite3.sqlite_version_info >= (3, 35):
+        connection.exec_driver_sql('ALTER TABLE bot_account DROP COLUMN connection_data')
+    backfill_last_error_at(connection)
+
+def backfill_last_error_at(connection):
+    """وقت للأخطاء المرقاة من بيانات الاتصال (آخر نشاط أو الآن) حتى تظهر في قوائم الأخطاء"""
+    bots = BotAccount.__table__
+    connection.execute(bots.update()
+                       .where(bots.c.last_error.isnot(None), bots.c.last_error_at.is_(None))
+                       .values(last_error_at=db.func.coalesce(bots.c.last_activity, datetime.utcnow())))
+
+@migrations.migration(11, 'فهرسة نص السجلات المرمزة واسم المستخدم في البحث')
+def index_rendered_logs(connection, metadata):
+    for model in LOG_SEARCH_COLUMNS:
+        logsearch.uninstall(connection, model.__tablename__)
+        install_log_search_index(connection, model, rebuild=True)
+
+@migrations.migration(12, 'وقت آخر خطأ للبوتات المرحلة')
+def add_missing_last_error_at(connection, metadata):
+    # قواعد البيانات التي طبقت الترحيل 10 قبل أن يملأ last_error_at
+    backfill_last_error_at(connection)
+
+def hot_queries():
+    """الاستعلامات المتكررة التي يجب أن تستخدم فهرساً"""
+    now = datetime.utcnow()
+    return {
+        'subscription': db.select(db.func.max(Activation.expires_at)).where(
+            Activation.user_id == 1, Activation.status == 'active', Activation.expires_at > now),
+        'code_seats': db.select(db.func.count(Activation.id)).where(
+            Activation.code_id == 1, Activation.status == 'active'),
+        'expiry_sweep': db.select(Activation.user_id).where(
+            Activation.status == 'active', Activation.expires_at <= now),
+        'user_logs': db.select(ConnectionLog).where(ConnectionLog.user_id == 1)
+            .order_by(ConnectionLog.timestamp.desc()).limit(10),
+        'connection_logs': db.select(ConnectionLog).order_by(ConnectionLog.timestamp.desc()).limit(100),
+        'system_logs': db.select(SystemLog).order_by(SystemLog.timestamp.desc()).limit(100),
+        'user_bots': db.select(BotAccount).where(BotAccount.user_id == 1)
+            .order_by(BotAccount.created_at.desc()),
+        'user_bots_by_region': db.select(BotAccount).where(BotAccount.user_id == 1, BotAccount.region == 'ME')
+            .order_by(BotAccount.created_at.desc(), BotAccount.id.desc()).limit(50),
+        'user_bots_with_errors': db.select(BotAccount)
+            .where(BotAccount.user_id == 1, BotAccount.last_error_at.isnot(None))
+            .order_by(BotAccount.last_error_at.desc(), BotAccount.id.desc()).limit(50),
+        'active_codes': db.select(ActivationCode).where(ActivationCode.status == 'active')
+            .order_by(ActivationCode.created_at.desc()),
+        'codes_page': db.select(ActivationCode)
+            .order_by(ActivationCode.created_at.desc(), ActivationCode.id.desc()).limit(50),
+        'users_page': db.select(User).order_by(User.created_at.desc(), User.id.desc()).limit(50),
+        'logs_by_event': db.select(ConnectionLog).where(ConnectionLog.event == 1)
+            .order_by(ConnectionLog.timestamp.desc(), ConnectionLog.id.desc()).limit(50),
+        'system_logs_by_event': db.select(SystemLog).where(SystemLog.event == 101)
+            .order_by(SystemLog.timestamp.desc(), SystemLog.id.desc()).limit(50),
+    }
+
+def upgrade_database():
+    """إنشاء الجداول الجديدة وتطبيق الترحيلات على قاعدة بيانات موجودة
+
+    قاعدة بيانات على آخر إصدار لا يفحص فيها شيء آخر، لذلك كل جدول أو عمود
+    جديد يضاف بترحيل.
+    """
+    with db.engine.connect() as connection:
+        fresh = not db.inspect(connection).has_table('user')
+        if not fresh and migrations.current_version(connection) == migrations.head():
+            return []
+    
+    db.create_all()
+    with db.engine.begin() as connection:
+        scheduler.create_tables(connection)
+        rollups.create_tables(connection)
+    if fresh:
+        migrations.stamp(db.engine)
+        return []
+    return migrations.upgrade(db.engine, db.metadata)
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """تطبيق ترحيلات المخطط"""
+    for version, description in upgrade_database():
+        print(f"تم تطبيق الترحيل {version}: {description}")
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help='دورة واحدة ثم الخروج (مناسب لـ cron)')
+def run_jobs_command(once):
+    """تشغيل المجدول كعملية مستقلة"""
+    if once:
+        job_scheduler.run_pending()
+    else:
+        bot_workers.start()
+        job_scheduler.run_forever()
+
+@app.cli.command('jobs')
+def jobs_command():
+    """حالة المهام المجدولة"""
+    for job in job_scheduler.status():
+        error = f" - {job['last_error']}" if job['last_error'] else ''
+        click.echo(f"{job['name']}: التالي {job['next_run_at']}، آخر تشغيل {job['last_run_at']}، "
+                   f"فشل متتالٍ {job['failures']}{error}")
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """التحقق من أن الاستعلامات المتكررة تستخدم الفهارس (SQLite)"""
+    with db.engine.connect() as connection:
+        results = migrations.check_query_plans(connection, hot_queries())
+    
+    for name, plan, ok in results:
+        print(f"{'✓' if ok else '✗'} {name}: {' | '.join(plan)}")
+    if not all(ok for _, _, ok in results):
+        raise SystemExit(1)
 
 # --- تهيئة قاعدة البيانات وإنشاء مستخدم مطور افتراضي ---
 
 def init_database():
-    with app.app_context():
-        db.create_all()
+    """تهيئة المخطط والعدادات والمستخدم المطور، آمنة وسريعة عند كل تشغيل"""
+    with app.app_context(), migrations.exclusive(os.path.join(app.instance_path, 'init.lock')):
+        # العدادات تحدث مع كل كتابة، إعادة حسابها فقط بعد تغيير المخطط
+        if upgrade_database() or StatCounter.query.count() < len(STAT_COUNTERS):
+            rebuild_stat_counters()
         
         # إنشاء مستخدم مطور إذا لم يكن موجود
         if not User.query.filter_by(username='admin').first():
@@ -558,23 +2373,24 @@ def init_database():
             print("كلمة المرور: admin123")
             print("⚠️ يرجى تغيير كلمة المرور فوراً!")
 
-if __name__ == '__main__':
+def create_app():
+    """نقطة الدخول للخادم: gunicorn --preload -w 4 'app:create_app()'
+
+    النماذج والمسارات تسجل عند استيراد الوحدة، ومع --preload يحدث ذلك مرة
+    واحدة في العملية الرئيسية وتتشارك العمال الذاكرة بعد fork. هنا تهيئة
+    المخطط مرة واحدة، ثم إغلاق اتصالات المحرك حتى لا يرثها العمال؛ كل عامل
+    يفتح اتصالاته عند أول طلب. الاستدعاء المتكرر يعيد نفس التطبيق.
+    """
     init_database()
+    with app.app_context():
+        db.engine.dispose()
+    return app
+
+if __name__ == '__main__':
+    create_app()
     
-    # بدء خدمة فحص الصلاحيات في خيط منفصل
-    import threading
-    import time
-    
-    def background_checker():
-        while True:
-            try:
-                check_expired_activations()
-            except Exception as e:
-                print(f"خطأ في فحص الصلاحيات: {e}")
-            time.sleep(3600)  # فحص كل ساعة
-    
-    checker_thread = threading.Thread(target=background_checker)
-    checker_thread.daemon = True
-    checker_thread.start()
+    # بدء المهام الدورية في خيط منفصل
+    if app.config.get('SCHEDULER_IN_PROCESS', True):
+        job_scheduler.start()
     
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,468 @@
+"""
+قياس أداء اللوحة: توليد قاعدة بيانات تجريبية وقياس زمن المسارات
+
+    python benchmark.py generate --db bench/panel.db --users 100000 --logs 1000000 --codes 50000
+    python benchmark.py run --db bench/panel.db --requests 200
+    python benchmark.py run --db bench/panel.db --server --workers 4 --concurrency 16 --preload
+    python benchmark.py limiter --checks 200000 --processes 4
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+BENCH_PASSWORD = 'bench-password'
+BENCH_SECRET = 'bench-secret-key'
+CHUNK = 10000
+
+
+# (الاسم، الطريقة، المسار، المستخدم)
+ROUTES = [
+    ('login', 'POST', '/login', None),
+    ('dashboard', 'GET', '/dashboard', 'user'),
+    ('bots', 'GET', '/bots', 'user'),
+    ('developer', 'GET', '/developer', 'developer'),
+    ('developer_logs', 'GET', '/developer/logs', 'developer'),
+    ('activate', 'POST', '/activate', 'user'),
+    ('bots_start', 'POST', '/api/bots/start', 'user'),
+]
+
+
+def load_app(db_path):
+    """استيراد التطبيق بعد توجيهه لقاعدة البيانات التجريبية"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(db_path)
+    os.environ.setdefault('SECRET_KEY', BENCH_SECRET)
+    import app
+    return app
+
+
+def chunked(rows, size=CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def random_time(rng, now, days):
+    return now - timedelta(seconds=rng.randint(0, days * 86400))
+
+
+def generate(args):
+    if os.path.exists(args.db):
+        if not args.force:
+            sys.exit(f'{args.db} موجود، استخدم --force لاستبداله')
+        os.remove(args.db)
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+
+    panel = load_app(args.db)
+    db = panel.db
+    panel.init_database()
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    password_hash = hashlib.sha256(BENCH_PASSWORD.encode()).hexdigest()
+
+    def insert(model, rows):
+        started = time.perf_counter()
+        total = 0
+        for chunk in chunked(rows):
+            db.session.execute(model.__table__.insert(), chunk)
+            db.session.commit()
+            total += len(chunk)
+        print(f'{model.__tablename__}: {total} صف في {time.perf_counter() - started:.1f} ثانية')
+
+    with panel.app.app_context():
+        insert(panel.User, (
+            {
+                'username': name,
+                'password_hash': password_hash,
+                'is_developer': name == 'bench_dev',
+                'created_at': random_time(rng, now, 365),
+                'status': 'active' if rng.random() > 0.02 else 'banned',
+            }
+            for name in ['bench_dev', 'bench_user'] + [f'user{i}' for i in range(args.users)]
+        ))
+        first_user, last_user = db.session.query(
+            db.func.min(panel.User.id), db.func.max(panel.User.id)
+        ).filter(panel.User.username != 'admin').one()
+        bench_user = first_user + 1
+
+        insert(panel.ActivationCode, (
+            {
+                'code': f'BENCH-{i:08d}',
+                'duration_days': duration,
+                'max_users': max_users,
+                'remaining_seats': max_users,
+                'created_at': created_at,
+                'expires_at': created_at + timedelta(days=365),
+                'status': 'active' if rng.random() > 0.1 else 'inactive',
+            }
+            for i in range(args.codes)
+            for duration in [rng.choice([1, 7, 30, 90])]
+            for max_users in [rng.choice([1, 1, 1, 3, 10])]
+            for created_at in [random_time(rng, now, 365)]
+        ))
+        first_code, last_code = db.session.query(
+            db.func.min(panel.ActivationCode.id), db.func.max(panel.ActivationCode.id)
+        ).one()
+
+        def activations():
+            yield {'user_id': bench_user, 'code_id': first_code, 'activated_at': now,
+                   'expires_at': now + timedelta(days=365), 'status': 'active'}
+            for _ in range(args.activations):
+                activated_at = random_time(rng, now, 180)
+                expires_at = activated_at + timedelta(days=rng.choice([1, 7, 30, 90]))
+                yield {
+                    'user_id': rng.randint(first_user, last_user),
+                    'code_id': rng.randint(first_code, last_code),
+                    'activated_at': activated_at,
+                    'expires_at': expires_at,
+                    'status': 'active' if expires_at > now else 'expired',
+                }
+        insert(panel.Activation, activations())
+
+        insert(panel.BotAccount, (
+            {
+                'user_id': bench_user if i < 50 else rng.randint(first_user, last_user),
+                'uid': str(rng.randint(10 ** 8, 10 ** 10)),
+                'password': 'x',
+                'nickname': f'bot{i}',
+                'status': status,
+                'region': rng.choice(panel.app.config['GAME_REGIONS']),
+                'last_error': 'connection timeout' if status == 'error' else None,
+                'last_error_at': created_at if status == 'error' else None,
+                'created_at': created_at,
+                'connection_blob': {'server': f'10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+                                    'port': 39698, 'session': f'{rng.getrandbits(128):032x}'},
+            }
+            for i in range(args.bots)
+            for status in [rng.choice(['active', 'inactive', 'inactive', 'error'])]
+            for created_at in [random_time(rng, now, 180)]
+        ))
+
+        logevents = panel.logevents
+
+        def event_params(name):
+            if name in ('subscription', 'activation', 'code_deletion', 'expiration'):
+                return {'code': f'BENCH-{rng.randint(0, args.codes - 1):08d}',
+                        'days': rng.choice([1, 7, 30, 90]) if name == 'subscription' else None}
+            if name in ('bot_added', 'bot_deleted'):
+                return {'uid': str(rng.randint(10 ** 8, 10 ** 10))}
+            if name == 'invite_sent':
+                return {'player_id': str(rng.randint(10 ** 8, 10 ** 10))}
+            if name == 'code_creation':
+                return {'count': 100, 'batch_id': f'{rng.getrandbits(64):016x}'}
+            return {}
+
+        def log_row(model, events, user_id, timestamp):
+            """صف سجل مرمز، أو بالنص الكامل القديم مع --legacy-logs لقياس flask encode-logs"""
+            event = rng.choice(events)
+            params = logevents.encode_params(event_params(event.name))
+            row = {'user_id': user_id, 'event': event.code, 'params': params, 'timestamp': timestamp}
+            if args.legacy_logs:
+                label, text, details = logevents.render(event.code, params, f'user{user_id - first_user - 2}')
+                if model is panel.SystemLog:
+                    row.update(user_id=None, log_type=label, message=text, details=details)
+                else:
+                    row.update(action=label, details=text)
+                row.update(event=None, params=None)
+            return row
+
+        insert(panel.ConnectionLog, (
+            dict(log_row(panel.ConnectionLog, logevents.CONNECTION_EVENTS, user_id, random_time(rng, now, 90)),
+                 ip_address=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}')
+            for _ in range(args.logs)
+            for user_id in [rng.randint(first_user + 2, last_user)]
+        ))
+
+        insert(panel.SystemLog, (
+            log_row(panel.SystemLog, logevents.SYSTEM_EVENTS, rng.randint(first_user + 2, last_user),
+                    random_time(rng, now, 90))
+            for _ in range(args.system_logs)
+        ))
+
+        panel.rebuild_stat_counters()
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(name, latencies, wall, statuses, queries):
+    return {
+        'route': name,
+        'requests': len(latencies),
+        'statuses': dict(sorted(statuses.items())),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'rps': len(latencies) / wall if wall else 0,
+        'queries': sum(queries) / len(queries) if queries else None,
+    }
+
+
+def redeem_codes(panel, count):
+    """كودات جديدة بمقعد واحد لقياس مسار /activate"""
+    with panel.app.app_context():
+        _, codes = panel.mint_codes(count, 30, 1, None, 'benchmark')
+    return iter(codes)
+
+
+def request_payload(name, codes):
+    if name == 'login':
+        return {'data': {'username': 'bench_user', 'password': BENCH_PASSWORD}}
+    if name == 'activate':
+        return {'data': {'code': next(codes)}}
+    if name == 'bots_start':
+        return {'json': {'bot_ids': [1, 2, 3]}}
+    return {}
+
+
+def run_client(panel, args, routes):
+    """القياس عبر Flask test client داخل نفس العملية مع عد استعلامات SQL"""
+    db = panel.db
+    main_thread = threading.get_ident()
+    counter = [0]
+
+    def count_query(*_):
+        # خيط كاتب السجلات لا يحسب على الطلب
+        if threading.get_ident() == main_thread:
+            counter[0] += 1
+
+    with panel.app.app_context():
+        db.event.listen(db.engine, 'before_cursor_execute', count_query)
+
+    clients = {}
+    for role, username in (('user', 'bench_user'), ('developer', 'bench_dev')):
+        client = panel.app.test_client()
+        client.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+        clients[role] = client
+
+    codes = redeem_codes(panel, args.requests + args.warmup)
+    results = []
+    for name, method, path, role in routes:
+        latencies, statuses, queries = [], {}, []
+        wall_started = time.perf_counter()
+        for i in range(args.warmup + args.requests):
+            client = clients[role] if role else panel.app.test_client()
+            payload = request_payload(name, codes)
+            counter[0] = 0
+            started = time.perf_counter()
+            response = client.open(path, method=method, **payload)
+            elapsed = time.perf_counter() - started
+            if i < args.warmup:
+                wall_started = time.perf_counter()
+                continue
+            latencies.append(elapsed)
+            queries.append(counter[0])
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        results.append(summarize(name, latencies, time.perf_counter() - wall_started, statuses, queries))
+
+    panel.log_writer.flush()
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port):
+    """تشغيل gunicorn، يعيد (العملية، الثواني حتى أول استجابة HTTP)"""
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.abspath(args.db), SECRET_KEY=BENCH_SECRET)
+    command = [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-b', f'127.0.0.1:{port}',
+               '--log-level', 'warning']
+    if args.preload:
+        command.append('--preload')
+    started = time.perf_counter()
+    server = subprocess.Popen(command + ['app:create_app()'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            # المنفذ يفتح قبل جاهزية العمال، لذلك ننتظر استجابة فعلية
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=5).close()
+            return server, time.perf_counter() - started
+        except urllib.error.HTTPError:
+            return server, time.perf_counter() - started
+        except OSError:
+            time.sleep(0.05)
+    server.terminate()
+    sys.exit('تعذر تشغيل خادم gunicorn')
+
+
+def run_server(panel, args, routes):
+    """القياس عبر خادم gunicorn متعدد العمال وطلبات HTTP متزامنة"""
+    import requests
+
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    server, ready = start_server(args, port)
+    args.startup['server_ready_ms'] = ready * 1000
+    codes = redeem_codes(panel, args.requests + args.warmup)
+    codes_lock = threading.Lock()
+
+    def session_for(role):
+        session = requests.Session()
+        if role:
+            username = 'bench_user' if role == 'user' else 'bench_dev'
+            session.post(base + '/login', data={'username': username, 'password': BENCH_PASSWORD},
+                         allow_redirects=False)
+        return session
+
+    try:
+        results = []
+        for name, method, path, role in routes:
+            local = threading.local()
+
+            def one_request(_):
+                if not hasattr(local, 'session'):
+                    local.session = session_for(role)
+                with codes_lock:
+                    payload = request_payload(name, codes)
+                started = time.perf_counter()
+                response = local.session.request(method, base + path, allow_redirects=False, **payload)
+                return time.perf_counter() - started, response.status_code
+
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                list(pool.map(one_request, range(args.warmup)))
+                wall_started = time.perf_counter()
+                samples = list(pool.map(one_request, range(args.requests)))
+                wall = time.perf_counter() - wall_started
+
+            statuses = {}
+            for _, status in samples:
+                statuses[status] = statuses.get(status, 0) + 1
+            results.append(summarize(name, [elapsed for elapsed, _ in samples], wall, statuses, []))
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def print_report(results, startup):
+    print('startup: ' + '  '.join(f'{name}={value:.0f}' for name, value in startup.items()))
+    print(f"{'route':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'sql/req':>9}  statuses")
+    for row in results:
+        queries = '-' if row['queries'] is None else f"{row['queries']:.1f}"
+        print(f"{row['route']:<16}{row['requests']:>6}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{row['rps']:>10.1f}{queries:>9}  {row['statuses']}")
+
+
+def run(args):
+    if not os.path.exists(args.db):
+        sys.exit(f'{args.db} غير موجود، شغل generate أولاً')
+
+    started = time.perf_counter()
+    panel = load_app(args.db)
+    imported = time.perf_counter()
+    panel.create_app()
+    args.startup = {
+        'import_ms': (imported - started) * 1000,
+        'create_app_ms': (time.perf_counter() - imported) * 1000,
+    }
+
+    routes = [route for route in ROUTES if not args.routes or route[0] in args.routes]
+    results = run_server(panel, args, routes) if args.server else run_client(panel, args, routes)
+
+    print_report(results, args.startup)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'mode': 'server' if args.server else 'client', 'startup': args.startup,
+                       'results': results}, output, ensure_ascii=False, indent=2)
+
+
+def limiter_worker(path, checks, keys, seed):
+    from ratelimit import SlidingWindowCounter
+
+    counter = SlidingWindowCounter(path, window=900)
+    rng = random.Random(seed)
+    names = [f'ip:10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}' for _ in range(keys)]
+    started = time.perf_counter()
+    for i in range(checks):
+        key = names[i % keys]
+        # نفس نمط /login: فحص ثم تسجيل محاولة فاشلة
+        counter.count(key)
+        counter.hit(key)
+    return time.perf_counter() - started
+
+
+def limiter(args):
+    """تكلفة فحص حد المحاولات (count + hit) مع عمليات تتشارك نفس الملف"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    path = os.path.join(os.path.dirname(os.path.abspath(args.db)), 'login.attempts')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(args.processes) as pool:
+        durations = list(pool.map(limiter_worker, [path] * args.processes, [args.checks] * args.processes,
+                                  [args.keys] * args.processes, range(args.processes)))
+    wall = time.perf_counter() - started
+
+    total = args.checks * args.processes
+    per_check = sum(durations) / total
+    print(f'processes={args.processes} checks={total} keys/process={args.keys}')
+    print(f'{per_check * 1e6:.2f} µs/check  {total / wall:,.0f} checks/s (wall, incl. startup)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء لوحة التحكم')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    gen = commands.add_parser('generate', help='توليد قاعدة بيانات تجريبية')
+    gen.add_argument('--db', default='bench/panel.db')
+    gen.add_argument('--users', type=int, default=100000)
+    gen.add_argument('--codes', type=int, default=50000)
+    gen.add_argument('--activations', type=int, default=100000)
+    gen.add_argument('--bots', type=int, default=50000)
+    gen.add_argument('--logs', type=int, default=1000000)
+    gen.add_argument('--system-logs', type=int, default=100000)
+    gen.add_argument('--seed', type=int, default=1)
+    gen.add_argument('--force', action='store_true')
+    gen.add_argument('--legacy-logs', action='store_true', help='سجلات بالنص الكامل كما قبل الترميز')
+    gen.set_defaults(handler=generate)
+
+    bench = commands.add_parser('run', help='قياس زمن المسارات')
+    bench.add_argument('--db', default='bench/panel.db')
+    bench.add_argument('--requests', type=int, default=200, help='طلبات لكل مسار')
+    bench.add_argument('--warmup', type=int, default=10)
+    bench.add_argument('--routes', nargs='*', help='تقييد القياس بمسارات معينة')
+    bench.add_argument('--server', action='store_true', help='استخدام خادم gunicorn بدل test client')
+    bench.add_argument('--workers', type=int, default=4)
+    bench.add_argument('--concurrency', type=int, default=16)
+    bench.add_argument('--preload', action='store_true', help='gunicorn --preload (تهيئة مرة واحدة في العملية الرئيسية)')
+    bench.add_argument('--output', help='حفظ النتائج بصيغة JSON')
+    bench.set_defaults(handler=run)
+
+    limit = commands.add_parser('limiter', help='قياس تكلفة فحص حد محاولات الدخول')
+    limit.add_argument('--db', default='bench/panel.db', help='ملف العداد ينشأ بجانبها')
+    limit.add_argument('--checks', type=int, default=200000, help='فحوص لكل عملية')
+    limit.add_argument('--processes', type=int, default=4)
+    limit.add_argument('--keys', type=int, default=1000)
+    limit.set_defaults(handler=limiter)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
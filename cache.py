@@ -0,0 +1,131 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # ويندوز
+    fcntl = None
+
+
+class GenerationTable:
+    """جدول أرقام أجيال في ملف مُعيَّن بالذاكرة يتشاركه جميع عمال gunicorn
+
+    الخانة 0 هي الجيل العام، وباقي الخانات لكل مفتاح (معرف المستخدم مثلاً).
+    زيادة رقم الخانة في أي عامل تُبطل الإدخالات المخزنة في جميع العمال.
+    """
+
+    SLOT = struct.Struct('<Q')
+
+    def __init__(self, path, slots=4096):
+        self.path = path
+        self.slots = slots
+        size = self.SLOT.size * (slots + 1)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+
+        self._lock = threading.Lock()
+
+    def _offset(self, key):
+        # hash() للنصوص يختلف بين العمليات، لذلك نستخدم crc32
+        if not isinstance(key, int):
+            key = zlib.crc32(str(key).encode())
+        return self.SLOT.size * (1 + key % self.slots)
+
+    def _read(self, offset):
+        return self.SLOT.unpack_from(self._map, offset)[0]
+
+    def _increment(self, offset):
+        with self._lock:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                self.SLOT.pack_into(self._map, offset, self._read(offset) + 1)
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def get(self, key):
+        """رقم الجيل الحالي للمفتاح (يشمل الجيل العام)"""
+        return (self._read(0), self._read(self._offset(key)))
+
+    def bump(self, key):
+        """إبطال مفتاح واحد في جميع العمال"""
+        self._increment(self._offset(key))
+
+    def bump_all(self):
+        """إبطال جميع المفاتيح في جميع العمال"""
+        self._increment(0)
+
+
+class GenerationCache:
+    """ذاكرة مؤقتة داخل العملية مع مدة صلاحية وإبطال عبر GenerationTable"""
+
+    def __init__(self, generations, ttl=300):
+        self.generations = generations
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def is_valid(self, value):
+        return True
+
+    def get(self, key, loader):
+        """القيمة المخزنة أو نتيجة loader(key) عند الغياب أو الإبطال"""
+        generation = self.generations.get(key)
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            value, entry_generation, cached_at = entry
+            if (entry_generation == generation
+                    and time.monotonic() - cached_at < self.ttl
+                    and self.is_valid(value)):
+                return value
+
+        value = loader(key)
+        with self._lock:
+            self._entries[key] = (value, generation, time.monotonic())
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        self.generations.bump(key)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._entries.clear()
+        self.generations.bump_all()
+
+
+class SubscriptionCache(GenerationCache):
+    """ذاكرة مؤقتة لحالة اشتراك كل مستخدم (تاريخ انتهاء التفعيل النشط)
+
+    الإدخال ينتهي تلقائياً عند انتهاء الاشتراك، ويُبطل عبر GenerationTable
+    عند التفعيل أو فحص الصلاحيات المنتهية.
+    """
+
+    def is_valid(self, expires_at):
+        return expires_at is None or expires_at > datetime.utcnow()
+
+
+class IdentityCache(GenerationCache):
+    """ذاكرة مؤقتة قصيرة العمر لهوية المستخدم (id, username, is_developer, status)
+
+    تُبطل صراحة عند تغيير الحالة أو صلاحية المطور.
+    """
+
+    def __init__(self, generations, ttl=60):
+        super().__init__(generations, ttl)
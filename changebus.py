@@ -0,0 +1,36 @@
+import threading
+import time
+
+
+class ChangeBus:
+    """إشعارات "تغير شيء يخص المستخدم" بين جميع عمال gunicorn
+
+    publish يزيد جيل المستخدم في GenerationTable (ملف مشترك) ويوقظ
+    المنتظرين في نفس العملية فوراً، والمنتظرون في العمليات الأخرى يلاحظون
+    التغيير خلال poll_interval ثانية بقراءة الذاكرة فقط بدون قاعدة البيانات.
+    الإشعار لا يحمل البيانات، المستمع يعيد قراءة ما تغير بنفسه.
+    """
+
+    def __init__(self, generations, poll_interval=0.5):
+        self.generations = generations
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+
+    def generation(self, user_id):
+        return self.generations.get(user_id)
+
+    def publish(self, user_id):
+        self.generations.bump(user_id)
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, user_id, generation, timeout):
+        """انتظار تغير جيل المستخدم عن generation، يعيد الجيل الحالي"""
+        deadline = time.monotonic() + timeout
+        while True:
+            current = self.generations.get(user_id)
+            remaining = deadline - time.monotonic()
+            if current != generation or remaining <= 0:
+                return current
+            with self._cond:
+                self._cond.wait(min(self.poll_interval, remaining))
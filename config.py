@@ -1,4 +1,6 @@
 import os
+import secrets
+import time
 from datetime import timedelta
 
 class Config:
@@ -9,11 +11,34 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///panel.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # SQLite: تطبق عند كل اتصال، WAL يسمح للقراء بالعمل أثناء الكتابة
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # ميلي ثانية
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,  # بالكيلوبايت (64MB)
+        'temp_store': 'MEMORY',
+    }
+    
+    # Postgres: إعدادات مجمع الاتصالات لكل عامل
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1']
+    
     # إعدادات الجلسة
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     SESSION_COOKIE_SECURE = os.environ.get('FLASK_ENV') == 'production'
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    IDENTITY_CACHE_TTL = 60  # مدة تخزين هوية المستخدم بالثواني
+    
+    # ذاكرة الصفحات المؤقتة والضغط (brotli اختياري: pip install brotli)
+    PAGE_CACHE_SIZE = 1000  # صفحات محفوظة في كل عامل
+    COMPRESS_MIN_SIZE = 500  # الاستجابات الأصغر لا تضغط (بايت)
+    COMPRESS_LEVEL = 6  # مستوى gzip
     
     # إعدادات الرفع
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
@@ -45,8 +70,88 @@ class Config:
     # إعدادات السجلات
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_FILE = 'logs/panel.log'
+    LOG_BATCH_SIZE = 200  # عدد السجلات في كل إدراج
+    LOG_FLUSH_INTERVAL = 1.0  # أقصى مدة انتظار قبل الكتابة بالثواني
+    LOG_QUEUE_SIZE = 10000  # بعدها ينتظر الطلب (backpressure)
+    LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', 90))  # الأقدم ينقل للأرشيف
+    LOG_ARCHIVE_DIR = os.environ.get('LOG_ARCHIVE_DIR')  # الافتراضي instance/archive
+    LOG_ARCHIVE_BATCH = 1000  # صفوف كل دفعة حذف
+    LOG_ARCHIVE_PAUSE = 0.05  # مهلة بين الدفعات لإفساح المجال للكتابة (ثواني)
+    LOG_ENCODE_BATCH = 2000  # صفوف كل دفعة عند ترميز السجلات النصية القديمة
+    LOG_ENCODE_PAUSE = 0.05
+    
+    # المهام الدورية (فحص الصلاحيات، أرشفة السجلات) وطابور أوامر البوتات
+    # عند False لا تشغلها عمال الويب وتشغل بـ flask run-jobs في عملية مستقلة
+    SCHEDULER_IN_PROCESS = os.environ.get('SCHEDULER_IN_PROCESS', 'true').lower() in ['true', 'on', '1']
+    SCHEDULER_LEASE_TTL = 30  # مدة عقد القيادة بالثواني
+    SCHEDULER_POLL_INTERVAL = 5  # أقصى انتظار بين الدورات بالثواني
+    EXPIRY_CHECK_INTERVAL = 300  # فحص الصلاحيات حتى بدون موعد انتهاء معروف
+    LOG_ARCHIVE_INTERVAL = 24 * 3600
+    ROLLUP_INTERVAL = 60  # تحديث التجميعات اليومية للإحصائيات (ثواني)
+    ROLLUP_BATCH = 50000  # معرفات كل معاملة عند بناء التجميعات
+    BOT_JOB_WORKERS = int(os.environ.get('BOT_JOB_WORKERS', 4))  # خيوط التنفيذ في كل عملية
+    BOT_JOB_CONCURRENCY = int(os.environ.get('BOT_JOB_CONCURRENCY', 16))  # أقصى أوامر قيد التنفيذ معاً
+    BOT_JOB_TIMEOUT = 600  # أمر قيد التنفيذ أطول من هذا يعاد للطابور (ثواني)
+    BOT_STUB_DELAY = 2.0  # مدة المنفذ التجريبي إلى أن يدمج كود البوتات (ثواني)
+    BULK_CHUNK_SIZE = 1000  # صفوف كل عبارة في العمليات الجماعية للمطور
+    
+    # بث الأحداث (/api/events): كل اتصال يشغل خيطاً، شغل gunicorn بـ -k gthread
+    EVENTS_KEEPALIVE = 15  # تعليق keepalive عند عدم وجود أحداث (ثواني)
+    EVENTS_MAX_DURATION = 300  # بعدها يغلق البث ويعيد المتصفح الاتصال تلقائياً (ثواني)
+    
+    # إعدادات القياسات (/developer/metrics)
+    METRICS_SLOW_REQUEST = 0.5  # الطلب الأبطأ من هذا يسجل مع استعلاماته (ثواني)
+    METRICS_FLUSH_INTERVAL = 5.0  # كتابة قياسات العامل للملف المشترك كل (ثواني)
     
     # إعدادات الأمان
     PASSWORD_MIN_LENGTH = 8
-    MAX_LOGIN_ATTEMPTS = 5
+    MAX_LOGIN_ATTEMPTS = 5  # محاولات فاشلة لكل اسم مستخدم خلال LOCKOUT_TIME
+    MAX_LOGIN_ATTEMPTS_PER_IP = 20  # محاولات فاشلة لكل عنوان IP خلال LOCKOUT_TIME
     LOCKOUT_TIME = 900  # 15 دقيقة بالثواني
+
+
+def database_uri(config):
+    """رابط قاعدة البيانات مع تصحيح صيغة postgres:// القديمة"""
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(config):
+    """خيارات محرك SQLAlchemy حسب نوع قاعدة البيانات"""
+    uri = database_uri(config)
+    if uri.startswith('sqlite'):
+        # مهلة القفل على مستوى المشغل تطابق busy_timeout
+        return {'connect_args': {'timeout': config['SQLITE_PRAGMAS']['busy_timeout'] / 1000}}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def instance_secret(instance_path):
+    """مفتاح سري عشوائي يحفظ في instance/secret_key عند أول تشغيل
+
+    كل العمال وإعادات التشغيل تقرأ نفس الملف فلا تنكسر الجلسات بينها.
+    """
+    path = os.path.join(instance_path, 'secret_key')
+    os.makedirs(instance_path, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # عامل آخر أنشأه، ننتظر حتى تكتمل كتابته
+        for _ in range(50):
+            with open(path) as source:
+                secret = source.read().strip()
+            if secret:
+                return secret
+            time.sleep(0.01)
+        raise RuntimeError(f'{path} فارغ')
+    secret = secrets.token_hex(32)
+    with os.fdopen(fd, 'w') as output:
+        output.write(secret)
+    return secret
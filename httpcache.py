@@ -0,0 +1,94 @@
+"""
+ذاكرة مؤقتة للصفحات المعروضة، ETag، وضغط الاستجابات (gzip/brotli)
+
+الصفحة تحفظ في ذاكرة العملية مع ETag محسوب من أرقام الأجيال التي تعتمد
+عليها، فتغير البيانات يغير الـ ETag بدون قراءة قاعدة البيانات. النسخ
+المضغوطة تحفظ مع الصفحة حتى لا يعاد ضغطها في كل طلب.
+"""
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # اختياري: pip install brotli
+    brotli = None
+
+COMPRESSIBLE = {
+    'text/html', 'text/plain', 'text/css', 'text/csv',
+    'application/json', 'application/javascript', 'image/svg+xml',
+}
+
+BROTLI_QUALITY = 5  # أسرع بكثير من 11 مع نسبة ضغط قريبة لصفحات HTML
+
+
+def make_etag(*parts):
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def choose_encoding(accept_encodings):
+    """أفضل ترميز يقبله العميل (request.accept_encodings)، أو None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class CachedPage:
+    __slots__ = ('etag', 'mimetype', 'last_modified', 'bodies')
+
+    def __init__(self, etag, mimetype, body):
+        self.etag = etag
+        self.mimetype = mimetype
+        self.last_modified = time.time()
+        self.bodies = {None: body}
+
+
+class PageCache:
+    """صفحات معروضة داخل العملية (LRU) مفتاحها (المستخدم، المسار)"""
+
+    def __init__(self, max_entries=1000, min_size=500, level=6):
+        self.max_entries = max_entries
+        self.min_size = min_size
+        self.level = level
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, etag):
+        """الصفحة المحفوظة إذا كان ETag لم يتغير"""
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                return None
+            if page.etag != etag:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return page
+
+    def put(self, key, etag, mimetype, body):
+        page = CachedPage(etag, mimetype, body)
+        with self._lock:
+            self._entries[key] = page
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return page
+
+    def body(self, page, encoding):
+        """محتوى الصفحة بالترميز المطلوب، يعيد (المحتوى، الترميز الفعلي)"""
+        if encoding is None or len(page.bodies[None]) < self.min_size:
+            return page.bodies[None], None
+        body = page.bodies.get(encoding)
+        if body is None:
+            body = page.bodies[encoding] = compress(page.bodies[None], encoding, self.level)
+        return body, encoding
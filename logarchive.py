@@ -0,0 +1,112 @@
+"""
+أرشفة السجلات القديمة في ملفات NDJSON مضغوطة مقسمة حسب اليوم
+
+المسار: <directory>/<table>/<YYYY-MM-DD>/<first_id>.ndjson.gz
+
+كل دفعة تكتب أولاً إلى ملف مؤقت ثم تنقل بـ os.replace، وبعدها تحذف صفوفها
+من الجدول في معاملة قصيرة. إذا توقفت العملية بين الكتابة والحذف تعيد
+الدورة التالية نفس الدفعة (أقدم الصفوف أولاً) فتكتب فوق نفس الملف بدون
+تكرار.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+SUFFIX = '.ndjson.gz'
+
+
+def _encode(row):
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in row.items()}
+
+
+def _write(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with gzip.open(temporary, 'wt', encoding='utf-8') as output:
+        for row in rows:
+            output.write(json.dumps(row, ensure_ascii=False) + '\n')
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(temporary, path)
+
+
+def archive_table(engine, table, before, directory, batch_size=1000, pause=0.05):
+    """نقل صفوف table الأقدم من before إلى الأرشيف على دفعات، يعيد عدد الصفوف
+
+    pause مهلة بين الدفعات حتى لا يحتكر الحذف قفل الكتابة.
+    """
+    timestamp = table.c.timestamp
+    query = (sa.select(table).where(timestamp < before)
+             .order_by(timestamp, table.c.id).limit(batch_size))
+    moved = 0
+
+    while True:
+        with engine.connect() as connection:
+            rows = [dict(row._mapping) for row in connection.execute(query)]
+        if not rows:
+            return moved
+
+        partitions = {}
+        for row in rows:
+            partitions.setdefault(row['timestamp'].date(), []).append(_encode(row))
+        for day, partition in partitions.items():
+            _write(os.path.join(directory, table.name, day.isoformat(),
+                                f"{partition[0]['id']}{SUFFIX}"), partition)
+
+        with engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.id.in_([row['id'] for row in rows])))
+        moved += len(rows)
+
+        if len(rows) < batch_size:
+            return moved
+        time.sleep(pause)
+
+
+def partitions(directory, table, since=None, until=None):
+    """أيام الأرشيف المتوفرة لجدول ضمن المدى [since, until)"""
+    root = os.path.join(directory, table)
+    if not os.path.isdir(root):
+        return []
+    days = []
+    for name in sorted(os.listdir(root)):
+        try:
+            day = datetime.strptime(name, '%Y-%m-%d')
+        except ValueError:
+            continue
+        if since and day + timedelta(days=1) <= since:
+            continue
+        if until and day >= until:
+            continue
+        days.append(name)
+    return days
+
+
+def read(directory, table, since=None, until=None, match=None):
+    """قراءة متدفقة لصفوف الأرشيف بترتيب زمني
+
+    match قاموس {عمود: قيمة} للتصفية بالمساواة. الصفوف تعاد كقواميس
+    والتواريخ كنص ISO كما خزنت.
+    """
+    for day in partitions(directory, table, since, until):
+        folder = os.path.join(directory, table, day)
+        names = [name for name in os.listdir(folder) if name.endswith(SUFFIX)]
+        rows = []
+        for name in sorted(names, key=lambda name: int(name[:-len(SUFFIX)])):
+            with gzip.open(os.path.join(folder, name), 'rt', encoding='utf-8') as source:
+                for line in source:
+                    row = json.loads(line)
+                    moment = datetime.fromisoformat(row['timestamp'])
+                    if since and moment < since or until and moment >= until:
+                        continue
+                    if match and any(str(row.get(key)) != str(value) for key, value in match.items()):
+                        continue
+                    rows.append((moment, row['id'], row))
+        # الترتيب داخل يوم واحد فقط، فالذاكرة محدودة بحجم أرشيف يوم
+        rows.sort(key=lambda item: item[:2])
+        for _, _, row in rows:
+            yield row
@@ -0,0 +1,153 @@
+"""
+ترميز أحداث السجلات برقم صغير ومعاملات منظمة
+
+السجل يحفظ رقم الحدث (event) ومعاملاته القليلة بصيغة JSON مختصرة (params)،
+واسم المستخدم يؤخذ من user_id، أما النص العربي فيبنى من القالب عند العرض
+فقط. أرقام الأحداث مخزنة في قاعدة البيانات فلا تغير رقماً موجوداً ولا تعد
+استخدامه، أضف أحداثاً جديدة بأرقام جديدة.
+"""
+import json
+import re
+import string
+from collections import namedtuple
+
+# label: قيمة action لسجل الاتصال أو log_type لسجل النظام
+# text: قوالب details (الاتصال) أو message (النظام)، يستخدم أول قالب تتوفر كل حقوله
+# details: قوالب details لسجل النظام
+Event = namedtuple('Event', 'code name label text details')
+
+CONNECTION_EVENTS = [
+    Event(1, 'login', 'تسجيل دخول', ('المستخدم {username} قام بتسجيل الدخول',), ()),
+    Event(2, 'logout', 'تسجيل خروج', ('المستخدم {username} قام بتسجيل الخروج',), ()),
+    Event(3, 'subscription', 'تفعيل اشتراك', ('كود: {code} - المدة: {days} يوم',), ()),
+    Event(4, 'bot_added', 'إضافة بوت', ('UID: {uid}',), ()),
+    Event(5, 'bot_deleted', 'حذف بوت', ('UID: {uid}',), ()),
+    Event(6, 'invite_sent', 'إرسال دعوة', ('لـ Player ID: {player_id}',), ()),
+]
+
+SYSTEM_EVENTS = [
+    Event(101, 'register', 'register', ('مستخدم جديد {username} قام بالتسجيل',), ()),
+    Event(102, 'activation', 'activation', ('المستخدم {username} قام بتفعيل الكود {code}',), ()),
+    Event(103, 'code_creation', 'code_creation',
+          ('المطور {username} أنشأ {count} كود', 'المطور {username} أنشأ الكود {code}'),
+          ('الدفعة: {batch_id}',)),
+    Event(104, 'code_deletion', 'code_deletion', ('المطور {username} عطل الكود {code}',), ()),
+    Event(105, 'expiration', 'expiration', ('انتهت صلاحية المستخدم {username}',), ('الكود: {code}',)),
+    Event(106, 'bulk_operation', 'bulk_operation',
+          ('المطور {username} نفذ {operation} على {count} من {entity}',), ('المعايير: {criteria}',)),
+]
+
+BY_CODE = {event.code: event for event in CONNECTION_EVENTS + SYSTEM_EVENTS}
+CONNECTION_BY_NAME = {event.name: event for event in CONNECTION_EVENTS}
+SYSTEM_BY_NAME = {event.name: event for event in SYSTEM_EVENTS}
+CONNECTION_BY_LABEL = {event.label: event for event in CONNECTION_EVENTS}
+SYSTEM_BY_LABEL = {event.label: event for event in SYSTEM_EVENTS}
+
+_formatter = string.Formatter()
+
+
+def _fields(template):
+    return {name for _, name, _, _ in _formatter.parse(template) if name}
+
+
+def encode_params(params):
+    """JSON مختصر للمعاملات غير الفارغة، أو None"""
+    params = {key: value for key, value in params.items() if value is not None}
+    if not params:
+        return None
+    return json.dumps(params, ensure_ascii=False, separators=(',', ':'))
+
+
+def decode_params(params):
+    return json.loads(params) if params else {}
+
+
+def render_template(templates, values):
+    for template in templates:
+        if _fields(template) <= values.keys():
+            return template.format(**values)
+    return ''
+
+
+def render(code, params, username):
+    """(label، النص، التفاصيل) لحدث مرمز"""
+    event = BY_CODE[code]
+    values = dict(decode_params(params), username=username)
+    return event.label, render_template(event.text, values), render_template(event.details, values)
+
+
+def _sql_literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def render_template_sql(templates, field):
+    """تعبير SQL يبني النص بأول قالب تتوفر كل حقوله، كما يفعل render_template
+
+    field(اسم) يعيد تعبير SQL لقيمة الحقل. username متوفر دائماً مثل render.
+    """
+    expression = "''"
+    for template in reversed(templates):
+        parts, conditions = [], []
+        for literal, name, _, _ in _formatter.parse(template):
+            if literal:
+                parts.append(_sql_literal(literal))
+            if name:
+                parts.append(field(name))
+                if name != 'username':
+                    conditions.append(f'{field(name)} IS NOT NULL')
+        text = ' || '.join(parts) or "''"
+        if not conditions:
+            expression = text
+        else:
+            expression = f"CASE WHEN {' AND '.join(conditions)} THEN {text} ELSE {expression} END"
+    return expression
+
+
+def render_sql(events, event_column, index, field):
+    """تعبير SQL لجزء من render (0 label، 1 النص، 2 التفاصيل) حسب رقم الحدث"""
+    cases = []
+    for event in events:
+        if index == 0:
+            value = _sql_literal(event.label)
+        else:
+            value = render_template_sql(event.text if index == 1 else event.details, field)
+        cases.append(f'WHEN {event.code} THEN {value}')
+    return f"CASE {event_column} {' '.join(cases)} END"
+
+
+def matching_events(events, text):
+    """الأحداث التي يحتوي اسمها أو النص الثابت في قوالبها على text (للبحث بدون فهرس)"""
+    found = []
+    for event in events:
+        literals = [event.label]
+        for template in event.text + event.details:
+            literals.extend(literal for literal, _, _, _ in _formatter.parse(template))
+        if any(text in literal for literal in literals):
+            found.append(event)
+    return found
+
+
+def _pattern(template):
+    """تعبير نمطي يستخرج حقول القالب من نص مبني به"""
+    parts = []
+    for literal, name, _, _ in _formatter.parse(template):
+        parts.append(re.escape(literal))
+        if name:
+            parts.append(f'(?P<{name}>.+?)')
+    return re.compile(''.join(parts) + r'\Z', re.S)
+
+
+def parse(templates, text):
+    """حقول نص قديم مبني بأحد القوالب (مع username)، أو None إذا لم يطابق أياً منها"""
+    if not text:
+        return {}
+    for template in templates:
+        match = _pattern(template).match(text)
+        if match is None:
+            continue
+        values = match.groupdict()
+        for key in ('count', 'days'):
+            if values.get(key, '').isdigit():
+                values[key] = int(values[key])
+        return values
+    return None
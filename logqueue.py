@@ -0,0 +1,101 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LogWriter:
+    """كاتب سجلات غير متزامن يجمع الأحداث في دفعات
+
+    الأحداث توضع في طابور داخل العملية، وخيط خلفي يكتبها عبر write_batch
+    عند امتلاء الدفعة (batch_size) أو مرور flush_interval ثانية.
+    عند امتلاء الطابور ينتظر المستدعي put_timeout ثانية ثم يكتب الحدث بنفسه
+    بدلاً من فقدانه.
+    """
+
+    def __init__(self, write_batch, batch_size=200, flush_interval=1.0,
+                 max_queue=10000, put_timeout=0.5):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # الخيوط لا تنتقل مع fork، لذلك كل عامل gunicorn يبدأ خيطه الخاص
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def put(self, model, row):
+        """إضافة صف للطابور (model هو نموذج الجدول)"""
+        self._ensure_started()
+        try:
+            self._queue.put((model, row), timeout=self.put_timeout)
+        except queue.Full:
+            self._write([(model, row)])
+
+    def _run(self):
+        events = self._queue
+        while True:
+            item = events.get()
+            if item is None:
+                events.task_done()
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = events.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            for _ in range(len(batch) + stop):
+                events.task_done()
+            if stop:
+                return
+
+    def _write(self, batch):
+        try:
+            self.write_batch(batch)
+        except Exception:
+            logger.exception('فشل كتابة %d سجل', len(batch))
+
+    def flush(self):
+        """انتظار كتابة كل ما في الطابور"""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """كتابة ما تبقى وإيقاف الخيط (يستدعى عند الإغلاق)"""
+        if self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._pid = None
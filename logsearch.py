@@ -0,0 +1,126 @@
+"""
+بحث نصي كامل في السجلات عبر SQLite FTS5
+
+كل جدول سجلات له جدول FTS5 خارجي المحتوى (content=) يحدث بمشغلات
+(triggers) عند الإدراج والحذف والتعديل، لذلك الإدراج الجماعي من كاتب
+السجلات أو INSERT ... SELECT يفهرس تلقائياً.
+"""
+import sqlalchemy as sa
+
+TOKENIZER = "unicode61 remove_diacritics 2 tokenchars '-_'"
+
+
+def fts_name(table):
+    return f'{table}_fts'
+
+
+def available(connection):
+    """هل قاعدة البيانات SQLite مع دعم FTS5"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    options = {row[0] for row in connection.exec_driver_sql('PRAGMA compile_options')}
+    return 'ENABLE_FTS5' in options
+
+
+def view_name(table):
+    return f'{table}_search'
+
+
+def install(connection, table, columns, rebuild=False, view=None):
+    """إنشاء جدول FTS5 ومشغلات المزامنة لجدول سجلات (idempotent)
+
+    view استعلام SELECT اختياري يعيد id والأعمدة المفهرسة (مثل نص السجل
+    المبني من رقم الحدث ومعاملاته مع اسم المستخدم)، فيفهرس ناتجه بدل أعمدة
+    الجدول نفسه. قيم الصف يجب ألا تتغير بدون تعديل الصف (الحذف من الفهرس
+    يعيد حسابها).
+    """
+    if not available(connection):
+        return False
+
+    fts = fts_name(table)
+    column_list = ', '.join(columns)
+    content = table
+    if view is not None:
+        content = view_name(table)
+        connection.exec_driver_sql(f'CREATE VIEW IF NOT EXISTS {content} AS {view}')
+
+    connection.exec_driver_sql(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+        f'{column_list}, content={content}, content_rowid=id, tokenize="{TOKENIZER}")'
+    )
+    if view is None:
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        connection.exec_driver_sql(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN '
+            f'INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+        )
+        connection.exec_driver_sql(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        connection.exec_driver_sql(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE ON {table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+            f'INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+        )
+    else:
+        # القيم القديمة تقرأ من الـ view قبل الحذف أو التعديل والجديدة بعد الإدراج أو التعديل
+        insert = f'INSERT INTO {fts}(rowid, {column_list}) SELECT id, {column_list} FROM {content} WHERE id = new.id;'
+        delete = (f"INSERT INTO {fts}({fts}, rowid, {column_list}) "
+                  f"SELECT 'delete', id, {column_list} FROM {content} WHERE id = old.id;")
+        for name, timing, body in (('insert', 'AFTER INSERT', insert), ('delete', 'BEFORE DELETE', delete),
+                                   ('before_update', 'BEFORE UPDATE', delete), ('update', 'AFTER UPDATE', insert)):
+            connection.exec_driver_sql(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_{name} {timing} ON {table} BEGIN {body} END'
+            )
+    if rebuild:
+        connection.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return True
+
+
+def uninstall(connection, table):
+    """حذف جدول FTS5 ومشغلاته (لتغيير الأعمدة المفهرسة ثم install من جديد)"""
+    if not available(connection):
+        return False
+    fts = fts_name(table)
+    for trigger in ('insert', 'delete', 'before_update', 'update'):
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {fts}_{trigger}')
+    connection.exec_driver_sql(f'DROP TABLE IF EXISTS {fts}')
+    connection.exec_driver_sql(f'DROP VIEW IF EXISTS {view_name(table)}')
+    return True
+
+
+def optimize(connection, table):
+    """دمج أجزاء الفهرس بعد تعديل عدد كبير من الصفوف"""
+    if available(connection):
+        connection.exec_driver_sql(f"INSERT INTO {fts_name(table)}({fts_name(table)}) VALUES ('optimize')")
+
+
+def match_expression(text):
+    """تحويل نص المستخدم إلى تعبير MATCH آمن
+
+    كل كلمة تصبح عبارة بين علامتي تنصيص (بحث AND)، والكلمة المنتهية بـ *
+    تصبح بحثاً بالبادئة.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def search(connection, table, text, limit, offset=0):
+    """معرفات الصفوف المطابقة مرتبة حسب الصلة (bm25)، يعيد [(id, score)]"""
+    expression = match_expression(text)
+    if not expression:
+        return []
+    fts = fts_name(table)
+    rows = connection.execute(
+        sa.text(f'SELECT rowid, bm25({fts}) FROM {fts} WHERE {fts} MATCH :expression '
+                f'ORDER BY rank LIMIT :limit OFFSET :offset'),
+        {'expression': expression, 'limit': limit, 'offset': offset}
+    )
+    return [(row[0], row[1]) for row in rows]
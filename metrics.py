@@ -0,0 +1,232 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def new_histogram():
+    return {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+
+
+def observe(histogram, value):
+    for i, bound in enumerate(BUCKETS):
+        if value <= bound:
+            break
+    else:
+        i = len(BUCKETS)
+    histogram['buckets'][i] += 1
+    histogram['sum'] += value
+    histogram['count'] += 1
+
+
+def merge_histogram(target, source):
+    target['buckets'] = [a + b for a, b in zip(target['buckets'], source['buckets'])]
+    target['sum'] += source['sum']
+    target['count'] += source['count']
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class Metrics:
+    """قياسات كل طلب: زمن المسار، عدد وزمن استعلامات SQL، وزمن القوالب
+
+    كل عامل يجمع قياساته في الذاكرة ويكتبها كل flush_interval ثانية إلى
+    ملف باسم رقم العملية في directory، و render يجمع ملفات كل العمال.
+    """
+
+    def __init__(self, directory, slow_threshold=0.5, flush_interval=5.0, max_slow=50):
+        self.directory = directory
+        self.slow_threshold = slow_threshold
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._templates = {}
+        self._slow = deque(maxlen=max_slow)
+        self._flushed_at = 0.0
+
+    def init_app(self, app):
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # --- الخطافات ---
+
+    def _before_request(self):
+        g.metrics = {'start': time.perf_counter(), 'queries': [], 'templates': {}}
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'metrics' in g:
+            conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('metrics_query_start')
+        if starts and has_request_context() and 'metrics' in g:
+            g.metrics['queries'].append((statement, time.perf_counter() - starts.pop()))
+
+    def _before_render(self, sender, template, context, **extra):
+        if 'metrics' in g:
+            g.metrics['templates'][template.name] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        if 'metrics' in g and template.name in g.metrics['templates']:
+            elapsed = time.perf_counter() - g.metrics['templates'].pop(template.name)
+            with self._lock:
+                observe(self._templates.setdefault(template.name, new_histogram()), elapsed)
+
+    def _after_request(self, response):
+        state = g.pop('metrics', None)
+        if state is None:
+            return response
+
+        elapsed = time.perf_counter() - state['start']
+        endpoint = request.endpoint or 'unknown'
+        queries = state['queries']
+        slow = elapsed >= self.slow_threshold
+
+        with self._lock:
+            stats = self._requests.get(endpoint)
+            if stats is None:
+                stats = self._requests[endpoint] = dict(new_histogram(), sql_queries=0,
+                                                        sql_seconds=0.0, slow=0, status={})
+            observe(stats, elapsed)
+            stats['sql_queries'] += len(queries)
+            stats['sql_seconds'] += sum(duration for _, duration in queries)
+            status = str(response.status_code)
+            stats['status'][status] = stats['status'].get(status, 0) + 1
+            if slow:
+                stats['slow'] += 1
+                self._slow.append({
+                    'endpoint': endpoint,
+                    'path': request.path,
+                    'seconds': round(elapsed, 4),
+                    'time': time.time(),
+                    'queries': [{'sql': sql[:500], 'seconds': round(duration, 4)}
+                                for sql, duration in queries],
+                })
+
+        if slow:
+            logger.warning('طلب بطيء %s %.3f ثانية، %d استعلام', request.path, elapsed, len(queries))
+
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+        return response
+
+    # --- التخزين والتجميع بين العمال ---
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def flush(self):
+        """كتابة قياسات هذا العامل إلى ملفه"""
+        self._flushed_at = time.monotonic()
+        with self._lock:
+            snapshot = json.dumps({
+                'requests': self._requests,
+                'templates': self._templates,
+                'slow': list(self._slow),
+            })
+        path = self._path(os.getpid())
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as output:
+            output.write(snapshot)
+        os.replace(temporary, path)
+
+    def collect(self):
+        """دمج قياسات كل العمال الأحياء"""
+        self.flush()
+        requests, templates, slow = {}, {}, []
+
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            pid = int(name[:-len('.json')])
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                os.remove(self._path(pid))
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(self._path(pid)) as source:
+                    snapshot = json.load(source)
+            except (OSError, ValueError):
+                continue
+
+            for endpoint, stats in snapshot['requests'].items():
+                total = requests.get(endpoint)
+                if total is None:
+                    requests[endpoint] = copy.deepcopy(stats)
+                    continue
+                merge_histogram(total, stats)
+                total['sql_queries'] += stats['sql_queries']
+                total['sql_seconds'] += stats['sql_seconds']
+                total['slow'] += stats['slow']
+                for status, count in stats['status'].items():
+                    total['status'][status] = total['status'].get(status, 0) + count
+            for template, histogram in snapshot['templates'].items():
+                merge_histogram(templates.setdefault(template, new_histogram()), histogram)
+            slow.extend(snapshot['slow'])
+
+        slow.sort(key=lambda item: item['time'], reverse=True)
+        return requests, templates, slow
+
+    def render(self):
+        """القياسات بصيغة نص Prometheus"""
+        requests, templates, _ = self.collect()
+        lines = []
+
+        def histogram(name, help_text, label, items):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, stats in sorted(items.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), stats['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label}="{_label(key)}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label}="{_label(key)}"}} {stats["sum"]}')
+                lines.append(f'{name}_count{{{label}="{_label(key)}"}} {stats["count"]}')
+
+        def counter(name, help_text, values):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for labels, value in values:
+                rendered = ','.join(f'{key}="{_label(val)}"' for key, val in labels.items())
+                lines.append(f'{name}{{{rendered}}} {value}')
+
+        histogram('panel_request_duration_seconds', 'Request latency by endpoint',
+                  'endpoint', requests)
+        counter('panel_requests_total', 'Requests by endpoint and status',
+                [({'endpoint': endpoint, 'status': status}, count)
+                 for endpoint, stats in sorted(requests.items())
+                 for status, count in sorted(stats['status'].items())])
+        counter('panel_sql_queries_total', 'SQL statements executed by endpoint',
+                [({'endpoint': endpoint}, stats['sql_queries']) for endpoint, stats in sorted(requests.items())])
+        counter('panel_sql_duration_seconds_total', 'Time spent in SQL by endpoint',
+                [({'endpoint': endpoint}, stats['sql_seconds']) for endpoint, stats in sorted(requests.items())])
+        counter('panel_slow_requests_total', 'Requests slower than the slow threshold',
+                [({'endpoint': endpoint}, stats['slow']) for endpoint, stats in sorted(requests.items())])
+        histogram('panel_template_render_seconds', 'Template render time', 'template', templates)
+        return '\n'.join(lines) + '\n'
+
+    def slow_requests(self):
+        """آخر الطلبات البطيئة مع قائمة استعلاماتها"""
+        return self.collect()[2]
@@ -0,0 +1,141 @@
+"""
+ترحيل مخطط قاعدة البيانات بدون أدوات خارجية
+
+كل ترحيل دالة مرقمة تستقبل (connection, metadata) وتسجل بـ @migration.
+رقم آخر ترحيل مطبق يحفظ في جدول schema_version.
+"""
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import sqlalchemy as sa
+
+try:
+    import fcntl
+except ImportError:  # ويندوز
+    fcntl = None
+
+MIGRATIONS = []
+
+schema_version = sa.Table(
+    'schema_version', sa.MetaData(),
+    sa.Column('version', sa.Integer, nullable=False)
+)
+
+
+def migration(version, description):
+    """تسجيل دالة ترحيل برقم إصدار"""
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return fn
+    return decorator
+
+
+def head():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(connection):
+    schema_version.create(connection, checkfirst=True)
+    version = connection.execute(sa.select(sa.func.max(schema_version.c.version))).scalar()
+    return version or 0
+
+
+def _set_version(connection, version):
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert().values(version=version))
+
+
+def stamp(engine, version=None):
+    """تعليم قاعدة بيانات جديدة (أنشأها create_all) بأنها على آخر إصدار"""
+    with engine.begin() as connection:
+        schema_version.create(connection, checkfirst=True)
+        _set_version(connection, head() if version is None else version)
+
+
+def upgrade(engine, metadata):
+    """تطبيق الترحيلات غير المطبقة بالترتيب، كل ترحيل في معاملة مستقلة"""
+    with engine.begin() as connection:
+        version = current_version(connection)
+
+    applied = []
+    for number, description, fn in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as connection:
+            fn(connection, metadata)
+            _set_version(connection, number)
+        applied.append((number, description))
+    return applied
+
+
+@contextmanager
+def exclusive(path):
+    """قفل ملف بين العمليات حتى لا يهيئ عاملان المخطط معاً"""
+    with open(path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.lockf(lock_file, fcntl.LOCK_UN)
+
+
+def create_missing_indexes(connection, metadata):
+    """إنشاء الفهارس المعرفة في النماذج وغير الموجودة في قاعدة البيانات"""
+    inspector = sa.inspect(connection)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            # أعمدة يضيفها ترحيل لاحق تنشأ فهارسها في ذلك الترحيل
+            if index.name not in existing and {c.name for c in index.columns} <= columns:
+                index.create(connection)
+
+
+def add_column(connection, table, column):
+    """إضافة عمود لجدول موجود إذا لم يكن موجوداً، يعيد True عند الإضافة"""
+    inspector = sa.inspect(connection)
+    if column.name in {c['name'] for c in inspector.get_columns(table.name)}:
+        return False
+    preparer = connection.dialect.identifier_preparer
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.exec_driver_sql(
+        f'ALTER TABLE {preparer.format_table(table)} '
+        f'ADD COLUMN {preparer.format_column(column)} {column_type}'
+    )
+    return True
+
+
+def explain(connection, statement):
+    """خطة تنفيذ SQLite للاستعلام (EXPLAIN QUERY PLAN)"""
+    compiled = statement.compile(dialect=connection.dialect)
+    params = []
+    for name in compiled.positiontup:
+        value = compiled.params[name]
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat(' ')
+        params.append(value)
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), tuple(params))
+    return [row[-1] for row in rows]
+
+
+def uses_index(plan):
+    """هل يمر كل وصول للجداول عبر فهرس (وليس SCAN كامل)"""
+    return all(
+        'USING' in step
+        for step in plan
+        if step.startswith(('SCAN', 'SEARCH'))
+    )
+
+
+def check_query_plans(connection, queries):
+    """فحص أن كل استعلام مهم يستخدم فهرساً، يعيد [(الاسم، الخطة، النتيجة)]"""
+    results = []
+    for name, statement in queries.items():
+        plan = explain(connection, statement)
+        results.append((name, plan, uses_index(plan)))
+    return results
@@ -0,0 +1,77 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # ويندوز
+    fcntl = None
+
+
+class SlidingWindowCounter:
+    """عداد محاولات بنافذة منزلقة في ملف مُعيَّن بالذاكرة يتشاركه عمال gunicorn
+
+    كل مفتاح (عنوان IP أو اسم مستخدم) له خانة فيها بداية النافذة الثابتة
+    الحالية وعدد محاولاتها وعدد محاولات النافذة السابقة. التقدير المنزلق:
+        السابقة × (الجزء المتبقي منها داخل النافذة) + الحالية
+    المفاتيح التي تقع في نفس الخانة تتشارك العداد، وهذا يخطئ نحو المنع فقط.
+    """
+
+    SLOT = struct.Struct('<dII')
+
+    def __init__(self, path, window, slots=65536):
+        self.path = path
+        self.window = window
+        self.slots = slots
+        size = self.SLOT.size * slots
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+
+        # أقفال fcntl لا تمنع خيوط نفس العملية من بعضها
+        self._lock = threading.Lock()
+
+    def _offset(self, key):
+        return self.SLOT.size * (zlib.crc32(str(key).encode()) % self.slots)
+
+    def _update(self, key, fn):
+        """قراءة الخانة وتدويرها للنافذة الحالية ثم كتابة ما يعيده fn تحت القفل"""
+        offset = self._offset(key)
+        with self._lock:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, self.SLOT.size, offset)
+            try:
+                started, current, previous = self.SLOT.unpack_from(self._map, offset)
+                now = time.time()
+                window_start = now - now % self.window
+                if started != window_start:
+                    previous = current if started == window_start - self.window else 0
+                    current = 0
+                weight = 1 - (now - window_start) / self.window
+                result, current, previous = fn(previous * weight + current, current, previous)
+                self.SLOT.pack_into(self._map, offset, window_start, current, previous)
+                return result
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, self.SLOT.size, offset)
+
+    def count(self, key):
+        """عدد المحاولات المقدر خلال آخر window ثانية"""
+        return self._update(key, lambda estimate, current, previous: (estimate, current, previous))
+
+    def hit(self, key):
+        """تسجيل محاولة، يعيد التقدير بعدها"""
+        return self._update(key, lambda estimate, current, previous: (estimate + 1, current + 1, previous))
+
+    def reset(self, key):
+        self._update(key, lambda estimate, current, previous: (0, 0, 0))
@@ -0,0 +1,185 @@
+"""
+تجميعات يومية محدثة تدريجياً للإحصائيات (سلاسل زمنية)
+
+كل مقياس يعد صفوف جدول مصدر في اليوم، مقسمة اختيارياً حسب بُعد (الكود،
+مدة الخطة، نوع الحدث...). الصفوف الجديدة تضاف للتجميع حسب معرفها: كل
+مقياس يحفظ آخر معرف عالجه في rollup_watermark، فكل تحديث يقرأ الصفوف
+الجديدة فقط، والقراءة تكلف عدد الأيام لا عدد الأحداث.
+
+المعرفات تفترض أنها تظهر بترتيبها (كاتب واحد في SQLite). مع قواعد بيانات
+تلتزم فيها المعاملات بترتيب مختلف قد يفوت التحديث صفاً نادراً، وإعادة بناء
+الأيام الأخيرة بـ rebuild تصحح ذلك.
+"""
+from datetime import date, datetime, time, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+metadata = sa.MetaData()
+
+daily = sa.Table(
+    'daily_rollup', metadata,
+    sa.Column('metric', sa.String(50), primary_key=True),
+    sa.Column('day', sa.Date, primary_key=True),
+    sa.Column('dimension', sa.String(100), primary_key=True),  # '' بدون تقسيم
+    sa.Column('value', sa.Integer, nullable=False, default=0),
+)
+
+watermarks = sa.Table(
+    'rollup_watermark', metadata,
+    sa.Column('metric', sa.String(50), primary_key=True),
+    sa.Column('last_id', sa.Integer, nullable=False, default=0),
+)
+
+
+def create_tables(connection):
+    metadata.create_all(connection, checkfirst=True)
+
+
+class Rollup:
+    """مقياس يومي: عدد صفوف source في كل يوم من timestamp لكل قيمة dimension
+
+    select_from للربط مع جداول أخرى (مثل الكود للتقسيم حسب الخطة)، و where
+    شرط إضافي على الصفوف المعدودة. archived للمصادر التي تحذف صفوفها القديمة
+    (أرشفة السجلات) حتى لا تمحو إعادة البناء أياماً لم تعد في المصدر.
+    """
+
+    def __init__(self, metric, source, timestamp, dimension=None, select_from=None, where=None,
+                 archived=False):
+        self.metric = metric
+        self.source = source
+        self.timestamp = timestamp
+        self.dimension = dimension
+        self.select_from = source if select_from is None else select_from
+        self.where = where
+        self.archived = archived
+
+    def aggregate(self, *conditions):
+        """استعلام (اليوم، البعد، العدد) للصفوف المطابقة"""
+        day = sa.func.date(self.timestamp)
+        dimension = sa.literal('') if self.dimension is None else sa.cast(self.dimension, sa.String)
+        statement = (sa.select(day, dimension, sa.func.count())
+                     .select_from(self.select_from)
+                     .where(*conditions)
+                     .group_by(day, dimension))
+        if self.where is not None:
+            statement = statement.where(self.where)
+        return statement
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _add(connection, metric, rows):
+    """إضافة الأعداد للتجميع (upsert يجمع القيم)"""
+    values = [{'metric': metric, 'day': _as_date(day), 'dimension': dimension if dimension is not None else '',
+               'value': count} for day, dimension, count in rows]
+    if not values:
+        return
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(daily)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=['metric', 'day', 'dimension'],
+            set_={'value': daily.c.value + insert.excluded.value}
+        ), values)
+        return
+    for row in values:
+        updated = connection.execute(
+            daily.update()
+            .where(daily.c.metric == row['metric'], daily.c.day == row['day'],
+                   daily.c.dimension == row['dimension'])
+            .values(value=daily.c.value + row['value'])
+        ).rowcount
+        if not updated:
+            connection.execute(daily.insert().values(**row))
+
+
+def _watermark(connection, metric):
+    last_id = connection.execute(
+        sa.select(watermarks.c.last_id).where(watermarks.c.metric == metric)).scalar()
+    if last_id is None:
+        connection.execute(watermarks.insert().values(metric=metric, last_id=0))
+        return 0
+    return last_id
+
+
+def update(engine, rollup, batch_size=50000):
+    """إضافة الصفوف الجديدة منذ آخر تحديث، يعيد عدد الصفوف المعالجة
+
+    كل batch_size معرف في معاملة مستقلة، فالبناء الأول على جدول كبير لا
+    يحجز قاعدة البيانات طويلاً ويستأنف من حيث توقف.
+    """
+    id_column = rollup.source.c.id
+    with engine.connect() as connection:
+        high = connection.execute(sa.select(sa.func.max(id_column))).scalar() or 0
+
+    processed = 0
+    while True:
+        with engine.begin() as connection:
+            low = _watermark(connection, rollup.metric)
+            if low >= high:
+                return processed
+            upper = min(low + batch_size, high)
+            claimed = connection.execute(
+                watermarks.update()
+                .where(watermarks.c.metric == rollup.metric, watermarks.c.last_id == low)
+                .values(last_id=upper)
+            ).rowcount
+            if not claimed:  # عملية أخرى عالجت نفس المدى
+                continue
+            rows = connection.execute(rollup.aggregate(id_column > low, id_column <= upper)).all()
+            _add(connection, rollup.metric, rows)
+        processed += sum(count for _, _, count in rows)
+
+
+def rebuild(engine, rollup, since, until):
+    """إعادة حساب الأيام [since, until) من جدول المصدر، يعيد (من، إلى) الفعليين أو None
+
+    في المصادر المؤرشفة تبدأ إعادة البناء من اليوم التالي لأقدم صف باقٍ،
+    فالأيام المؤرشفة (واليوم المؤرشف جزئياً) يبقى تجميعها كما هو.
+    """
+    with engine.begin() as connection:
+        high = _watermark(connection, rollup.metric)
+        if rollup.archived:
+            oldest = connection.execute(sa.select(sa.func.min(rollup.timestamp))).scalar()
+            if oldest is not None:
+                since = max(since, _as_date(str(oldest)[:10]) + timedelta(days=1))
+        if since >= until:
+            return None
+
+        connection.execute(daily.delete().where(daily.c.metric == rollup.metric,
+                                                daily.c.day >= since, daily.c.day < until))
+        # الصفوف بعد المؤشر يضيفها update لاحقاً
+        rows = connection.execute(rollup.aggregate(
+            rollup.timestamp >= datetime.combine(since, time()),
+            rollup.timestamp < datetime.combine(until, time()),
+            rollup.source.c.id <= high)).all()
+        _add(connection, rollup.metric, rows)
+    return since, until
+
+
+def series(connection, metric, since, until, dimensions=None, top=None):
+    """سلسلة يومية لكل بعد مع أصفار للأيام الفارغة
+
+    يعيد (الأيام، {البعد: [القيم]}). top يحصر النتيجة في أكبر الأبعاد
+    مجموعاً خلال المدة.
+    """
+    conditions = [daily.c.metric == metric, daily.c.day >= since, daily.c.day < until]
+    if dimensions:
+        conditions.append(daily.c.dimension.in_(dimensions))
+    elif top:
+        total = sa.func.sum(daily.c.value)
+        leading = [dimension for (dimension,) in connection.execute(
+            sa.select(daily.c.dimension).where(*conditions)
+            .group_by(daily.c.dimension).order_by(total.desc()).limit(top))]
+        conditions.append(daily.c.dimension.in_(leading))
+
+    days = [since + timedelta(days=offset) for offset in range((until - since).days)]
+    position = {day: index for index, day in enumerate(days)}
+    values = {}
+    for day, dimension, value in connection.execute(
+            sa.select(daily.c.day, daily.c.dimension, daily.c.value).where(*conditions)):
+        values.setdefault(dimension, [0] * len(days))[position[_as_date(day)]] = value
+    return days, values
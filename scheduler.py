@@ -0,0 +1,266 @@
+"""
+مجدول مهام دائم تنفذه عملية واحدة فقط
+
+المهام مسجلة في جدول scheduled_job مع موعد تشغيلها التالي، والعملية التي
+تحمل عقد القيادة (scheduler_lease) هي وحدها التي تنفذها. العقد يجدد كل دورة
+وينتهي بعد lease_ttl ثانية فيستلمه عامل آخر إذا توقف القائد.
+
+كل تشغيل يحجز بتحديث شرطي لموعده، فلا تنفذ نفس الدورة مرتين حتى لو تداخل
+قائدان للحظة. أثناء تنفيذ المهمة يجدد خيط نبض العقد والحجز كل lease_ttl/3
+ثانية مهما طال التنفيذ، وإذا ماتت العملية أثناء التنفيذ تعاد المهمة بعد
+lease_ttl.
+"""
+import atexit
+import contextlib
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+metadata = sa.MetaData()
+
+jobs = sa.Table(
+    'scheduled_job', metadata,
+    sa.Column('name', sa.String(100), primary_key=True),
+    sa.Column('next_run_at', sa.DateTime, nullable=False),
+    sa.Column('last_run_at', sa.DateTime),
+    sa.Column('last_error', sa.Text),
+    sa.Column('failures', sa.Integer, nullable=False, default=0),
+)
+
+leases = sa.Table(
+    'scheduler_lease', metadata,
+    sa.Column('name', sa.String(50), primary_key=True),
+    sa.Column('owner', sa.String(100), nullable=False),
+    sa.Column('expires_at', sa.DateTime, nullable=False),
+)
+
+LEADER = 'leader'
+
+
+def create_tables(connection):
+    metadata.create_all(connection, checkfirst=True)
+
+
+class JobScheduler:
+    """تشغيل المهام الدورية المسجلة بـ @job في العملية القائدة فقط
+
+    get_engine يعيد محرك SQLAlchemy و context يعيد سياقاً تنفذ داخله كل
+    دورة (مثل app.app_context). المهمة التي تعيد datetime تقدم موعدها التالي
+    إليه إذا كان أقرب من interval. عند الفشل يعاد المحاولة بعد retry_delay
+    مضاعفاً مع كل فشل متتالٍ حتى max_backoff.
+    """
+
+    def __init__(self, get_engine, context=contextlib.nullcontext, lease_ttl=30,
+                 poll_interval=5, retry_delay=30, max_backoff=3600):
+        self.get_engine = get_engine
+        self.context = context
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.jobs = {}
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._ready = False
+
+    @property
+    def owner(self):
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def job(self, name, interval):
+        """تسجيل دالة كمهمة دورية كل interval ثانية"""
+        def decorator(fn):
+            self.jobs[name] = (fn, interval)
+            return fn
+        return decorator
+
+    # --- القيادة ---
+
+    def acquire(self, engine):
+        """أخذ عقد القيادة أو تجديده، يعيد True إذا كانت هذه العملية القائدة"""
+        now = datetime.utcnow()
+        until = now + timedelta(seconds=self.lease_ttl)
+        with engine.begin() as connection:
+            renewed = connection.execute(
+                leases.update()
+                .where(leases.c.name == LEADER,
+                       sa.or_(leases.c.owner == self.owner, leases.c.expires_at < now))
+                .values(owner=self.owner, expires_at=until)
+            ).rowcount
+        if renewed:
+            return True
+        try:
+            with engine.begin() as connection:
+                connection.execute(leases.insert().values(name=LEADER, owner=self.owner, expires_at=until))
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self):
+        """التخلي عن القيادة حتى يستلمها عامل آخر فوراً"""
+        with self.context():
+            with self.get_engine().begin() as connection:
+                connection.execute(leases.delete().where(leases.c.name == LEADER,
+                                                         leases.c.owner == self.owner))
+
+    def _setup(self, engine):
+        with engine.begin() as connection:
+            create_tables(connection)
+            existing = {name for (name,) in connection.execute(sa.select(jobs.c.name))}
+        for name in self.jobs.keys() - existing:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(jobs.insert().values(
+                        name=name, next_run_at=datetime.utcnow(), failures=0))
+            except IntegrityError:
+                pass
+        self._ready = True
+
+    # --- التنفيذ ---
+
+    def wake(self, name, when):
+        """تقديم موعد مهمة إلى when إذا كان أقرب (يعمل من أي عملية)"""
+        with self.get_engine().begin() as connection:
+            connection.execute(jobs.update()
+                               .where(jobs.c.name == name, jobs.c.next_run_at > when)
+                               .values(next_run_at=when))
+        self._wakeup.set()
+
+    def run_pending(self):
+        """دورة واحدة: تنفيذ المهام المستحقة إذا كانت العملية قائدة، يعيد مدة الانتظار"""
+        with self.context():
+            engine = self.get_engine()
+            if not self.acquire(engine):
+                return self.poll_interval
+            if not self._ready:
+                self._setup(engine)
+
+            now = datetime.utcnow()
+            with engine.connect() as connection:
+                due = [name for (name,) in connection.execute(
+                    sa.select(jobs.c.name).where(jobs.c.next_run_at <= now).order_by(jobs.c.next_run_at))]
+            for name in due:
+                if name in self.jobs:
+                    self._run_job(engine, name)
+
+            with engine.connect() as connection:
+                upcoming = connection.execute(sa.select(sa.func.min(jobs.c.next_run_at))).scalar()
+        if upcoming is None:
+            return self.poll_interval
+        remaining = (upcoming - datetime.utcnow()).total_seconds()
+        return max(0, min(self.poll_interval, remaining))
+
+    def _heartbeat(self, engine, name, claim, stop):
+        """تجديد عقد القيادة وحجز المهمة الجارية حتى يضبط stop
+
+        الحجز يمدد فقط إذا بقي موعده كما حجزناه، فإذا قدمه wake() يبقى
+        الموعد المقدم ويعتمد التحديث الأخير عليه.
+        """
+        while not stop.wait(self.lease_ttl / 3):
+            until = datetime.utcnow() + timedelta(seconds=self.lease_ttl)
+            try:
+                with engine.begin() as connection:
+                    renewed = connection.execute(
+                        leases.update()
+                        .where(leases.c.name == LEADER, leases.c.owner == self.owner)
+                        .values(expires_at=until)
+                    ).rowcount
+                    if not renewed:
+                        logger.warning('فقدت القيادة أثناء تنفيذ المهمة %s', name)
+                        return
+                    extended = connection.execute(
+                        jobs.update().where(jobs.c.name == name, jobs.c.next_run_at == claim['until'])
+                        .values(next_run_at=until)
+                    ).rowcount
+                if extended:
+                    claim['until'] = until
+            except Exception:
+                logger.exception('فشل تجديد حجز المهمة %s', name)
+
+    def _run_job(self, engine, name):
+        now = datetime.utcnow()
+        claim = {'until': now + timedelta(seconds=self.lease_ttl)}
+        with engine.begin() as connection:
+            failures = connection.execute(
+                sa.select(jobs.c.failures).where(jobs.c.name == name)).scalar()
+            claimed = connection.execute(
+                jobs.update().where(jobs.c.name == name, jobs.c.next_run_at <= now)
+                .values(next_run_at=claim['until'])
+            ).rowcount
+        if not claimed:
+            return
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(engine, name, claim, stop),
+                                     name=f'job-heartbeat-{name}', daemon=True)
+        heartbeat.start()
+        fn, interval = self.jobs[name]
+        try:
+            result = fn()
+        except Exception as exc:
+            delay = min(self.retry_delay * 2 ** failures, self.max_backoff)
+            logger.exception('فشلت المهمة %s، إعادة المحاولة بعد %d ثانية', name, delay)
+            values = {'failures': failures + 1, 'last_error': repr(exc)[:2000],
+                      'next_run_at': datetime.utcnow() + timedelta(seconds=delay)}
+        else:
+            next_run = datetime.utcnow() + timedelta(seconds=interval)
+            if isinstance(result, datetime):
+                next_run = min(next_run, result)
+            values = {'failures': 0, 'last_error': None, 'last_run_at': now, 'next_run_at': next_run}
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        with engine.begin() as connection:
+            leader = connection.execute(
+                sa.select(leases.c.owner).where(leases.c.name == LEADER)).scalar()
+            current = connection.execute(
+                sa.select(jobs.c.next_run_at).where(jobs.c.name == name)).scalar()
+            # إذا استلم عامل آخر القيادة وحجز المهمة فنتيجته هي المعتمدة
+            if leader != self.owner or current is None or current > claim['until']:
+                logger.warning('انتهى حجز المهمة %s قبل اكتمالها، لم تحفظ نتيجتها', name)
+                return
+            # wake() أثناء التنفيذ قد يكون قدم الموعد
+            if current < claim['until']:
+                values['next_run_at'] = min(values['next_run_at'], current)
+            connection.execute(jobs.update()
+                               .where(jobs.c.name == name, jobs.c.next_run_at == current)
+                               .values(**values))
+
+    def run_forever(self):
+        """حلقة المجدول في الخيط الحالي (للعامل المستقل)"""
+        atexit.register(self.release)
+        while True:
+            try:
+                delay = self.run_pending()
+            except Exception:
+                logger.exception('خطأ في دورة المجدول')
+                delay = self.poll_interval
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def start(self):
+        """تشغيل المجدول في خيط خلفي، مرة لكل عملية (بعد fork أيضاً)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            threading.Thread(target=self.run_forever, name='job-scheduler', daemon=True).start()
+
+    def status(self):
+        """حالة المهام من الجدول"""
+        with self.get_engine().connect() as connection:
+            return [dict(row._mapping) for row in connection.execute(
+                sa.select(jobs).order_by(jobs.c.next_run_at))]
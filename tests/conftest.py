@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ['SCHEDULER_IN_PROCESS'] = 'false'
+
+import app as panel  # noqa: E402
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    with panel.app.app_context():
+        panel.upgrade_database()
+    return panel.db
+
+
+@pytest.fixture
+def app_context():
+    with panel.app.app_context():
+        yield
+        panel.db.session.rollback()
+
+
+def make_user(username, **kwargs):
+    user = panel.User(username=username, **kwargs)
+    user.set_password('password123')
+    panel.db.session.add(user)
+    panel.db.session.commit()
+    return user
@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import pytest
+
+import app as panel
+from conftest import make_user
+
+
+@pytest.fixture
+def bot(app_context):
+    user = make_user(f'bot_owner_{datetime.utcnow().timestamp()}')
+    bot = panel.BotAccount(user_id=user.id, uid='1001', password='-',
+                           last_error='old error', last_error_at=datetime(2024, 1, 1))
+    panel.db.session.add(bot)
+    panel.db.session.commit()
+    return bot
+
+
+def run_job(monkeypatch, bot, result):
+    job = panel.BotJob(bot_id=bot.id, user_id=bot.user_id, action='start', status='running',
+                       started_at=datetime.utcnow())
+    panel.db.session.add(job)
+    panel.db.session.commit()
+    monkeypatch.setattr(panel, 'run_bot_action', result)
+    panel.execute_bot_job(job.id)
+    panel.db.session.expire_all()
+    return panel.db.session.get(panel.BotAccount, bot.id)
+
+
+def test_success_clears_last_error(monkeypatch, bot):
+    bot = run_job(monkeypatch, bot, lambda action, bot_id: ('active', {'region': 'EU'}))
+    assert (bot.region, bot.last_error, bot.last_error_at) == ('EU', None, None)
+
+
+def test_success_keeps_reported_last_error(monkeypatch, bot):
+    bot = run_job(monkeypatch, bot, lambda action, bot_id: (
+        'active', {'region': 'EU', 'last_error': 'handshake timeout', 'server': 'x1'}))
+    assert (bot.region, bot.last_error) == ('EU', 'handshake timeout')
+    assert bot.last_error_at > datetime(2024, 1, 1)
+    assert bot.connection_data == {'server': 'x1'}
+
+
+def test_failure_sets_last_error(monkeypatch, bot):
+    def fail(action, bot_id):
+        raise RuntimeError('login failed')
+    bot = run_job(monkeypatch, bot, fail)
+    assert (bot.status, bot.last_error) == ('error', 'login failed')
+    assert bot.last_error_at > datetime(2024, 1, 1)
+
+
+def test_connection_data_error_is_listed(app_context):
+    user = make_user('error_listing_owner')
+    bot = panel.BotAccount(user_id=user.id, uid='1002', password='-')
+    bot.set_connection_data({'last_error': 'banned', 'server': 'x1'})
+    panel.db.session.add(bot)
+    panel.db.session.commit()
+    assert bot.last_error_at is not None
+    
+    with panel.app.test_request_context('/bots?errors=1'):
+        bots, _ = panel.filtered_bots(user.id)
+    assert [listed.id for listed in bots] == [bot.id]
+
+
+def test_backfill_last_error_at(app_context):
+    user = make_user('backfill_owner')
+    bot = panel.BotAccount(user_id=user.id, uid='1003', password='-', last_error='boom')
+    panel.db.session.add(bot)
+    panel.db.session.commit()
+    panel.backfill_last_error_at(panel.db.session.connection())
+    panel.db.session.commit()
+    panel.db.session.expire_all()
+    assert panel.db.session.get(panel.BotAccount, bot.id).last_error_at is not None
+
+
+def test_add_bot_form_renders_regions(app_context):
+    make_user('add_bot_developer', is_developer=True)
+    client = panel.app.test_client()
+    client.post('/login', data={'username': 'add_bot_developer', 'password': 'password123'})
+    response = client.get('/bots/add')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'name="region"' in page
+    assert all(f'<option value="{region}">' in page for region in panel.app.config['GAME_REGIONS'])
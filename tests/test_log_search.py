@@ -0,0 +1,48 @@
+import pytest
+
+import app as panel
+import logevents
+import logsearch
+from conftest import make_user
+
+
+@pytest.fixture(scope='module')
+def connection():
+    with panel.app.app_context():
+        if not logsearch.available(panel.db.session.connection()):
+            pytest.skip('SQLite بدون FTS5')
+        user = make_user('alice_incident')
+        panel.db.session.add_all([
+            panel.ConnectionLog(user_id=user.id, event=logevents.CONNECTION_BY_NAME['login'].code),
+            panel.ConnectionLog(user_id=user.id, event=logevents.CONNECTION_BY_NAME['bot_added'].code,
+                                params=logevents.encode_params({'uid': '98765'})),
+            panel.SystemLog(user_id=user.id, event=logevents.SYSTEM_BY_NAME['activation'].code,
+                            params=logevents.encode_params({'code': 'ABCD-1234'})),
+        ])
+        panel.db.session.commit()
+        yield panel.db.session.connection()
+
+
+def search(connection, model, text):
+    rows = {row.id: row for row in model.query}
+    return [rows[hit_id] for hit_id, _ in logsearch.search(connection, model.__tablename__, text, 10)]
+
+
+def test_encoded_log_found_by_username(connection):
+    hits = search(connection, panel.ConnectionLog, 'alice_incident')
+    assert {log.action for log in hits} == {'تسجيل دخول', 'إضافة بوت'}
+
+
+def test_encoded_log_found_by_rendered_text(connection):
+    hits = search(connection, panel.ConnectionLog, 'تسجيل')
+    assert [log.details for log in hits] == ['المستخدم alice_incident قام بتسجيل الدخول']
+    assert [log.details for log in search(connection, panel.ConnectionLog, '98765')] == ['UID: 98765']
+    assert [log.message for log in search(connection, panel.SystemLog, 'ABCD-1234')] == \
+        ['المستخدم alice_incident قام بتفعيل الكود ABCD-1234']
+
+
+def test_deleted_log_removed_from_index(connection):
+    log = panel.ConnectionLog.query.filter_by(event=logevents.CONNECTION_BY_NAME['bot_added'].code).one()
+    panel.db.session.delete(log)
+    panel.db.session.commit()
+    assert search(panel.db.session.connection(), panel.ConnectionLog, '98765') == []
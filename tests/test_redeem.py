@@ -0,0 +1,46 @@
+import threading
+
+from sqlalchemy.exc import OperationalError
+
+import app as panel
+from conftest import make_user
+
+SEATS = 20
+THREADS = 16
+ATTEMPTS = 5
+
+
+def test_concurrent_redeem_never_exceeds_max_users(app_context):
+    users = [make_user(f'redeemer_{index}').id for index in range(THREADS)]
+    code = panel.ActivationCode(code=panel.generate_activation_code(), duration_days=1, max_users=SEATS)
+    panel.db.session.add(code)
+    panel.db.session.commit()
+    code_id = code.id
+    
+    results = []
+    start = threading.Barrier(THREADS)
+    
+    def hammer(user_id):
+        redeemed = 0
+        with panel.app.app_context():
+            code = panel.db.session.get(panel.ActivationCode, code_id)
+            start.wait()
+            for _ in range(ATTEMPTS):
+                try:
+                    if panel.redeem_code(user_id, code):
+                        redeemed += 1
+                except OperationalError:  # database is locked
+                    panel.db.session.rollback()
+        results.append(redeemed)
+    
+    workers = [threading.Thread(target=hammer, args=(user_id,)) for user_id in users]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    
+    panel.db.session.expire_all()
+    active = panel.Activation.query.filter_by(code_id=code_id, status='active').count()
+    assert sum(results) == active
+    assert 0 < active <= SEATS
+    assert panel.db.session.get(panel.ActivationCode, code_id).remaining_seats == SEATS - active
@@ -0,0 +1,72 @@
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """مجموعة خيوط تسحب المهام من طابور دائم (جدول في قاعدة البيانات)
+
+    claim يحجز المهمة التالية ويعيد معرفها (أو None إذا لم توجد مهمة
+    متاحة)، و execute ينفذها. الخيوط تنتظر notify أو poll_interval ثانية
+    قبل المحاولة مجدداً، لذلك المهام التي أضافتها عملية أخرى تلتقط أيضاً.
+    """
+
+    def __init__(self, claim, execute, workers=4, poll_interval=2.0, name='worker'):
+        self.claim = claim
+        self.execute = execute
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._wakeup = None
+        self._stopped = False
+        atexit.register(self.stop)
+
+    def start(self):
+        """تشغيل الخيوط مرة لكل عملية (بعد fork أيضاً)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wakeup = threading.Condition()
+            self._stopped = False
+            self._pid = os.getpid()
+            for number in range(self.workers):
+                threading.Thread(target=self._run, name=f'{self.name}-{number}', daemon=True).start()
+
+    def notify(self, count=1):
+        """إيقاظ خيوط منتظرة في هذه العملية بعد إضافة مهام"""
+        if self._pid != os.getpid():
+            return
+        with self._wakeup:
+            self._wakeup.notify(count)
+
+    def stop(self):
+        self._stopped = True
+        if self._pid == os.getpid():
+            with self._wakeup:
+                self._wakeup.notify_all()
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                job_id = self.claim()
+            except Exception:
+                logger.exception('خطأ في حجز مهمة (%s)', self.name)
+                job_id = None
+
+            if job_id is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            try:
+                self.execute(job_id)
+            except Exception:
+                logger.exception('خطأ في تنفيذ المهمة %s (%s)', job_id, self.name)